@@ -0,0 +1,26 @@
+"""add partial index for active games
+
+Revision ID: 5c2e9f41d7a3
+Revises: b0af3413dc8d
+Create Date: 2026-10-18 19:02:11.304512
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5c2e9f41d7a3'
+down_revision = 'b0af3413dc8d'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_index(
+        'ix_games_chat_id_active', 'games', ['chat_id'], unique=False, postgresql_where=sa.text('NOT is_finished')
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_games_chat_id_active', table_name='games')
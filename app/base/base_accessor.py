@@ -10,7 +10,8 @@ class BaseAccessor:
         self.app = app
         self.logger = getLogger("accessor")
         app.on_startup.append(self.connect)
-        app.on_cleanup.append(self.disconnect)
+        # Отключение в обратном порядке: сначала останавливаются те, кто зависит от остальных
+        app.on_cleanup.insert(0, self.disconnect)
 
     async def connect(self, app: "Application"):
         return
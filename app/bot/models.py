@@ -0,0 +1,10 @@
+from sqlalchemy import Column, String
+
+from app.store.database.sqlalchemy_base import db
+
+
+class PhotoAttachmentModel(db):
+    """Уже загруженное во VK фото: sha256 содержимого картинки -> строка вложения photo{owner_id}_{id}"""
+    __tablename__ = "photo_attachments"
+    content_hash = Column(String(64), primary_key=True)
+    attachment = Column(String, nullable=False)
@@ -0,0 +1,11 @@
+import typing
+
+from app.bot.views import VkCallbackView
+
+if typing.TYPE_CHECKING:
+    from app.web.app import Application
+
+
+def setup_routes(app: "Application"):
+    if app.config.bot.mode == "callback":
+        app.router.add_view("/vk.callback", VkCallbackView)
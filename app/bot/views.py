@@ -0,0 +1,20 @@
+from aiohttp.web import HTTPForbidden, Response
+
+from app.web.app import View
+
+
+class VkCallbackView(View):
+    async def post(self):
+        data = await self.request.json()
+        config = self.request.app.config.bot
+        if data.get("group_id") != config.group_id:
+            raise HTTPForbidden(reason="unknown group")
+        if data.get("secret") != config.secret:
+            raise HTTPForbidden(reason="invalid secret")
+
+        if data["type"] == "confirmation":
+            return Response(text=config.confirmation)
+
+        # VK повторяет доставку события, пока не получит ответ "ok"; повторы отбрасывает dispatch по event_id
+        await self.store.bots_manager.dispatcher.dispatch(data)
+        return Response(text="ok")
@@ -1,4 +1,4 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from typing import Optional
 
 
@@ -37,6 +37,7 @@ class Game:
     is_finished: bool
     questions: list["Question"]
     players: list["User"]
+    question_deck: list[int] = field(default_factory=list)
 
 
 @dataclass
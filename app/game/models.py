@@ -1,4 +1,5 @@
-from sqlalchemy import Table, Column, String, Integer, ForeignKey, Boolean, TIMESTAMP
+from sqlalchemy import Table, Column, String, Integer, ForeignKey, Boolean, TIMESTAMP, Index, text
+from sqlalchemy.dialects.postgresql import ARRAY
 from sqlalchemy.orm import relationship
 
 from app.game.dataclasses import Game, Chat, User, Question, Answer
@@ -49,6 +50,8 @@ class GameModel(db):
     players_score = Column(Integer, default=0, nullable=False)
     is_started = Column(Boolean, default=False, nullable=False)
     is_finished = Column(Boolean, default=False, nullable=False)
+    # Оставшиеся вопросы игры в порядке выдачи (с конца списка)
+    question_deck = Column(ARRAY(Integer), nullable=True)
     questions = relationship(
         "QuestionModel",
         secondary="games_questions"
@@ -58,6 +61,11 @@ class GameModel(db):
         secondary="games_users"
     )
 
+    __table_args__ = (
+        # Поиск активной игры чата
+        Index("ix_games_chat_id_active", "chat_id", postgresql_where=text("NOT is_finished")),
+    )
+
     def to_dc(self):
         return Game(
             id=self.id,
@@ -71,7 +79,8 @@ class GameModel(db):
             is_started=self.is_started,
             is_finished=self.is_finished,
             questions=self.questions,
-            players=self.players
+            players=self.players,
+            question_deck=list(self.question_deck or [])
         )
 
 
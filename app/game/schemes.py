@@ -1,4 +1,24 @@
-from marshmallow import Schema, fields
+from marshmallow import Schema, fields, validate
+from webargs.fields import DelimitedList
+
+# Максимальный размер страницы в списочных методах
+MAX_PAGE_SIZE = 1000
+
+
+def projection(schema: type[Schema]) -> DelimitedList:
+    """Параметр fields=a,b: список полей ответа из числа полей schema"""
+    return DelimitedList(
+        fields.Str(),
+        data_key="fields",
+        required=False,
+        validate=validate.ContainsOnly(list(schema._declared_fields))
+    )
+
+
+class PageSchema(Schema):
+    """Постраничная выборка по возрастанию id: limit записей с id больше after"""
+    limit = fields.Int(required=False, validate=validate.Range(min=1, max=MAX_PAGE_SIZE))
+    after = fields.Int(required=False)
 
 
 class AnswerSchema(Schema):
@@ -14,9 +34,10 @@ class QuestionSchema(Schema):
     answers = fields.Nested(AnswerSchema, many=True, required=True)
 
 
-class QuestionSimpleSchema(Schema):
+class QuestionSimpleSchema(PageSchema):
     id = fields.Int(required=False)
     is_approved = fields.Bool(required=False)
+    field_names = projection(QuestionSchema)
 
 
 class QuestionIdSchema(Schema):
@@ -25,6 +46,8 @@ class QuestionIdSchema(Schema):
 
 class ListQuestionSchema(Schema):
     questions = fields.Nested(QuestionSchema, many=True)
+    # id для параметра after следующей страницы, null на последней
+    next_after = fields.Int(allow_none=True)
 
 
 class UserSchema(Schema):
@@ -32,16 +55,14 @@ class UserSchema(Schema):
     vk_id = fields.Int(required=True)
 
 
-class UserIdSchema(Schema):
+class UserIdSchema(PageSchema):
     id = fields.Int(required=False)
+    field_names = projection(UserSchema)
 
 
 class ListUserSchema(Schema):
     users = fields.Nested(UserSchema, many=True)
-
-
-class GameIdSchema(Schema):
-    id = fields.Int(required=False)
+    next_after = fields.Int(allow_none=True)
 
 
 class GameSchema(Schema):
@@ -55,12 +76,14 @@ class GameSchema(Schema):
     players = fields.Nested(UserSchema, many=True)
 
 
-class ListGameSchema(Schema):
-    games = fields.Nested(GameSchema, many=True)
+class GameIdSchema(PageSchema):
+    id = fields.Int(required=False)
+    field_names = projection(GameSchema)
 
 
-class ChatIdSchema(Schema):
-    id = fields.Int(required=False)
+class ListGameSchema(Schema):
+    games = fields.Nested(GameSchema, many=True)
+    next_after = fields.Int(allow_none=True)
 
 
 class ChatSchema(Schema):
@@ -68,5 +91,11 @@ class ChatSchema(Schema):
     vk_id = fields.Int(required=True)
 
 
+class ChatIdSchema(PageSchema):
+    id = fields.Int(required=False)
+    field_names = projection(ChatSchema)
+
+
 class ChatListSchema(Schema):
     chats = fields.Nested(ChatSchema, many=True)
+    next_after = fields.Int(allow_none=True)
@@ -7,7 +7,20 @@ from app.game.schemes import QuestionSchema, QuestionIdSchema, ListQuestionSchem
 from app.web.app import View
 from app.web.mixins import AuthRequiredMixin
 from app.web.schemes import OkResponseSchema
-from app.web.utils import json_response
+from app.web.utils import json_response, ndjson_response
+
+
+def next_after(items: list, limit: int | None) -> int | None:
+    """Курсор следующей страницы: id последней записи, если страница заполнена целиком"""
+    if limit is not None and len(items) == limit:
+        return items[-1].id
+
+
+def only(key: str, field_names: list[str] | None) -> tuple[str, ...] | None:
+    """Проекция списочного ответа на запрошенные поля элементов"""
+    if field_names is None:
+        return None
+    return (*(f"{key}.{name}" for name in field_names), "next_after")
 
 
 class QuestionAddView(AuthRequiredMixin, View):
@@ -41,8 +54,20 @@ class QuestionListView(AuthRequiredMixin, View):
     @response_schema(ListQuestionSchema, 200)
     async def get(self):
         query = self.request.query
-        questions = await self.store.game.get_questions_list(query.get("id"), query.get("is_approved"))
-        return json_response(ListQuestionSchema().dump({"questions": questions}))
+        params = self.request["querystring"]
+        field_names = params.get("field_names")
+        questions = await self.store.game.get_questions_list(
+            query.get("id"),
+            query.get("is_approved"),
+            limit=params.get("limit"),
+            after=params.get("after"),
+            with_answers=field_names is None or "answers" in field_names
+        )
+        return json_response(
+            ListQuestionSchema(only=only("questions", field_names)).dump(
+                {"questions": questions, "next_after": next_after(questions, params.get("limit"))}
+            )
+        )
 
 
 class QuestionApproveView(AuthRequiredMixin, View):
@@ -67,25 +92,61 @@ class QuestionDeleteView(AuthRequiredMixin, View):
         return json_response({"result": "Question successfully deleted"})
 
 
+class QuestionExportView(AuthRequiredMixin, View):
+    async def get(self):
+        return await ndjson_response(self.request, self.store.game.stream_questions(), QuestionSchema())
+
+
 class GameListView(AuthRequiredMixin, View):
     @querystring_schema(GameIdSchema)
     @response_schema(ListGameSchema, 200)
     async def get(self):
-        games = await self.store.game.get_games_list(self.request.query.get("id"))
-        return json_response(ListGameSchema().dump({"games": games}))
+        params = self.request["querystring"]
+        field_names = params.get("field_names")
+        games = await self.store.game.get_games_list(
+            self.request.query.get("id"),
+            limit=params.get("limit"),
+            after=params.get("after"),
+            with_players=field_names is None or "players" in field_names,
+            with_questions=field_names is None or "questions" in field_names
+        )
+        return json_response(
+            ListGameSchema(only=only("games", field_names)).dump(
+                {"games": games, "next_after": next_after(games, params.get("limit"))}
+            )
+        )
 
 
 class UserListView(AuthRequiredMixin, View):
     @querystring_schema(UserIdSchema)
     @response_schema(ListUserSchema, 200)
     async def get(self):
-        users = await self.store.game.get_users_list(self.request.query.get("id"))
-        return json_response(ListUserSchema().dump({"users": users}))
+        params = self.request["querystring"]
+        users = await self.store.game.get_users_list(
+            self.request.query.get("id"), limit=params.get("limit"), after=params.get("after")
+        )
+        return json_response(
+            ListUserSchema(only=only("users", params.get("field_names"))).dump(
+                {"users": users, "next_after": next_after(users, params.get("limit"))}
+            )
+        )
 
 
 class ChatListView(AuthRequiredMixin, View):
     @querystring_schema(ChatIdSchema)
     @response_schema(ChatListSchema, 200)
     async def get(self):
-        chats = await self.store.game.get_chats_list(self.request.query.get("id"))
-        return json_response(ChatListSchema().dump({"chats": chats}))
+        params = self.request["querystring"]
+        chats = await self.store.game.get_chats_list(
+            self.request.query.get("id"), limit=params.get("limit"), after=params.get("after")
+        )
+        return json_response(
+            ChatListSchema(only=only("chats", params.get("field_names"))).dump(
+                {"chats": chats, "next_after": next_after(chats, params.get("limit"))}
+            )
+        )
+
+
+class GameExportView(AuthRequiredMixin, View):
+    async def get(self):
+        return await ndjson_response(self.request, self.store.game.stream_games(), GameSchema())
@@ -0,0 +1,176 @@
+import typing
+from datetime import datetime
+
+from app.store.game.accessor import WINNING_SCORE
+from app.store.bot.router import CommandContext, CommandRouter, MENTION_RE, USER_NAME_RE, user_mention, user_name
+from app.store.vk_api.dataclasses import Update
+
+if typing.TYPE_CHECKING:
+    from app.web.app import Application
+
+JOIN_PAYLOAD = "{\"game\":\"ready\"}"
+
+
+class GameCommands:
+    """Обработчики игровых команд чата"""
+
+    def __init__(self, app: "Application"):
+        self.app = app
+        self.router = CommandRouter()
+        self.router.add_action("chat_invite_user", self.invite_bot)
+        self.router.add_command("/start", self.start_game)
+        self.router.add_command("/ready", self.players_ready)
+        self.router.add_command("/join", self.join_game)
+        self.router.add_command("/answer", self.answer, with_args=True)
+        self.router.add_payload(JOIN_PAYLOAD, self.join_game)
+        self.router.add_mention(self.tag_user)
+
+    async def handle(self, update: dict) -> list[Update]:
+        return await self.router.route(update)
+
+    async def resolve_names(self, updates: list[Update]) -> list[Update]:
+        """Подстановка имен пользователей в ответы одним запросом к VK, уже вне транзакции"""
+        vk_ids = {int(vk_id) for update in updates for vk_id in USER_NAME_RE.findall(update.object.body)}
+        if not vk_ids:
+            return updates
+        names = {
+            info["id"]: f"{info['first_name']} {info['last_name']}"
+            for info in await self.app.store.vk_api.get_users_info(sorted(vk_ids))
+        }
+        for update in updates:
+            update.object.body = USER_NAME_RE.sub(
+                lambda match: names.get(int(match.group(1)), match.group(1)), update.object.body
+            )
+        return updates
+
+    async def _question_body(self, vk_chat_id: int) -> str:
+        question = await self.app.store.game.get_question_for_game(vk_chat_id=vk_chat_id)
+        body = f"{question.title}"
+        author = await self.app.store.game.get_author(question)
+        if author:
+            body += f"|{user_name(author.vk_id)}"
+        return body
+
+    # Если пригласили в беседу
+    async def invite_bot(self, ctx: CommandContext) -> list[Update]:
+        if ctx.message["action"]["member_id"] != -self.app.config.bot.group_id:
+            return []
+        await self.app.store.game.add_new_chat(vk_chat_id=ctx.peer_id)
+        return [
+            ctx.reply(
+                "🎈 Приветствую! Я бот для игры «Что? Где? Когда?» Чтобы начать игру выдайте мне "
+                "права администратора и напишите /start",
+                "invite_bot"
+            )
+        ]
+
+    # Если создали игру
+    async def start_game(self, ctx: CommandContext) -> list[Update]:
+        if await self.app.store.game.get_game_by_vk_id(vk_chat_id=ctx.peer_id, is_finished=False):
+            return [ctx.reply("❗ Вы не можете начать новую игру, пока не завершилась предыдущая!", "try_start_game")]
+
+        await self.app.store.game.create_new_game(chat_id=ctx.peer_id)
+        return [
+            ctx.reply(
+                "✔ Игра начнется как только будет написано /ready!\n"
+                "Чтобы присоединиться к игре нажмите на кнопку или напишите /join",
+                "start_game"
+            )
+        ]
+
+    # Запуск игры после набора участников
+    async def players_ready(self, ctx: CommandContext) -> list[Update]:
+        if not await self.app.store.game.get_game_by_vk_id(
+            vk_chat_id=ctx.peer_id,
+            is_started=False,
+            is_finished=False
+        ):
+            return [ctx.reply("❗ Сейчас вы не можете запустить игру!", "try_players_ready")]
+
+        await self.app.store.game.start_game(vk_chat_id=ctx.peer_id)
+        capitan = await self.app.store.game.choose_capitan(vk_chat_id=ctx.peer_id)
+        return [
+            ctx.reply(
+                f"✔ Игроки готовы, а значит можно начинать!\n\n"
+                f"🧢 Капитан команды - {user_mention(capitan.vk_id)}\n\n"
+                f"⏱ В течение 1.5 минуты после каждого вопроса, он должен выбрать "
+                f"(через обращение @) того, кто отвечает",
+                "capitan_chosen"
+            ),
+            ctx.reply(await self._question_body(ctx.peer_id), "players_ready"),
+        ]
+
+    # Выбор отвечающего
+    async def tag_user(self, ctx: CommandContext) -> list[Update]:
+        capitan = await self.app.store.game.get_capitan(ctx.peer_id)
+        if not capitan:
+            return []
+        if capitan.vk_id != ctx.from_id:
+            body = "❗ Вы не можете выбрать отвечающего, т.к. не являетесь капитаном команды!"
+        elif not await self.app.store.game.choose_respondent(
+            vk_chat_id=ctx.peer_id,
+            vk_user_id=int(MENTION_RE.fullmatch(ctx.text).group(1))
+        ):
+            body = "❗ Этот игрок не участвует в игре!"
+        else:
+            body = f"На вопрос отвечает {ctx.text}"
+        return [ctx.reply(body, "tag_user")]
+
+    # Ответ на вопрос
+    async def answer(self, ctx: CommandContext) -> list[Update]:
+        respondent = await self.app.store.game.get_respondent(vk_chat_id=ctx.peer_id)
+        if respondent is None or ctx.from_id != respondent.vk_id:
+            return [
+                ctx.reply(
+                    f"❗ {user_mention(ctx.from_id)}, "
+                    "Вы не были выбраны в качестве игрока, который должен отвечать!",
+                    "players_answer"
+                )
+            ]
+
+        question = await self.app.store.game.get_current_question(vk_chat_id=ctx.peer_id)
+        game = await self.app.store.game.get_game_by_vk_id(
+            vk_chat_id=ctx.peer_id,
+            is_started=True,
+            is_finished=False
+        )
+        if (datetime.now() - game.question_time).seconds > 90:
+            body = f"❌ Прошло более 1.5 минуты. Ответ не засчитан\n\n"
+            game = await self.app.store.game.add_score(vk_chat_id=ctx.peer_id, players_side=False)
+        elif await self.app.store.game.check_answer(question_id=question.id, answer=ctx.args):
+            game = await self.app.store.game.add_score(vk_chat_id=ctx.peer_id, players_side=True)
+            body = "✔ Это правильный ответ!\n\n"
+        else:
+            game = await self.app.store.game.add_score(vk_chat_id=ctx.peer_id, players_side=False)
+            body = "❌ Это неправильный ответ!\n\n"
+        body += f"🙋‍♂️Ваша команда {game.players_score} : 🤖 Бот {game.bot_score}"
+
+        updates = [
+            ctx.reply(body, "players_answer"),
+            ctx.reply(f"{question.answer_desc}", "get_answer"),
+        ]
+        if game.is_finished:
+            if game.players_score == WINNING_SCORE:
+                body = "\n\n🥳 Поздравляю! Вы победили!"
+            else:
+                body = "\n\n😕 Увы, вы проиграли!"
+            updates.append(ctx.reply(body, "finished"))
+        else:
+            updates.append(ctx.reply(await self._question_body(ctx.peer_id), "get_question"))
+        return updates
+
+    # Если была нажата кнопка "Присоединиться" или написали /join
+    async def join_game(self, ctx: CommandContext) -> list[Update]:
+        if not await self.app.store.game.get_game_by_vk_id(
+            vk_chat_id=ctx.peer_id,
+            is_started=False,
+            is_finished=False
+        ):
+            return [ctx.reply("❗ Нельзя присоединится к игре в данный момент", "try_join_game")]
+
+        await self.app.store.game.add_new_user(vk_id=ctx.from_id)
+        if not await self.app.store.game.add_new_player(vk_user_id=ctx.from_id, vk_chat_id=ctx.peer_id):
+            body = "❗ Вы уже присоединились к игре"
+        else:
+            body = f"➕ {user_mention(ctx.from_id)} присоединился к игре!"
+        return [ctx.reply(body, "join_game")]
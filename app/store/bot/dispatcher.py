@@ -0,0 +1,105 @@
+import asyncio
+import typing
+from asyncio import Task
+from logging import getLogger
+
+from app.base.lru_cache import LRUCache
+
+if typing.TYPE_CHECKING:
+    from app.web.app import Application
+
+
+class UpdateDispatcher:
+    """Распределение обновлений по очередям чатов: внутри чата строго по порядку, между чатами параллельно"""
+
+    def __init__(self, app: "Application", workers: int = 1, queue_size: int = 0, idle_timeout: float = 60):
+        self.app = app
+        self.logger = getLogger("dispatcher")
+        self.idle_timeout = idle_timeout
+        self.lanes: dict[int, asyncio.Queue[dict]] = {}
+        self.lane_tasks: dict[int, Task] = {}
+        # Ограничение числа одновременно обрабатываемых чатов
+        self.workers = asyncio.Semaphore(workers)
+        # Ограничение общего числа ожидающих обновлений: dispatch() ждет, пока не освободится место
+        self.pending = asyncio.Semaphore(queue_size) if queue_size > 0 else None
+        self.pending_count = 0
+        # event_id уже принятых событий: VK доставляет событие повторно, если не дождался ответа
+        self.seen_events = LRUCache(maxsize=10000)
+
+    @staticmethod
+    def get_peer_id(update: dict) -> int:
+        obj = update.get("object", {})
+        if "message" in obj:
+            return obj["message"]["peer_id"]
+        return obj.get("peer_id", 0)
+
+    async def dispatch(self, update: dict) -> None:
+        event_id = update.get("event_id")
+        if event_id is not None:
+            if self.seen_events.get(event_id) is not None:
+                self.logger.info(f"Повторная доставка события {event_id}")
+                return
+            self.seen_events.set(event_id, True)
+        if self.pending is not None:
+            if self.pending.locked():
+                self.logger.warning(f"Очередь обновлений заполнена ({self.pending_count}), ожидаем обработчиков")
+            await self.pending.acquire()
+        self.pending_count += 1
+
+        peer_id = self.get_peer_id(update)
+        lane = self.lanes.get(peer_id)
+        if lane is None:
+            lane = self.lanes[peer_id] = asyncio.Queue()
+            self.lane_tasks[peer_id] = asyncio.create_task(self._run_lane(peer_id, lane))
+        lane.put_nowait(update)
+
+    async def _run_lane(self, peer_id: int, lane: asyncio.Queue[dict]) -> None:
+        while True:
+            # Явная задача вместо wait_for: wait_for может потерять элемент, полученный в момент таймаута
+            getter = asyncio.ensure_future(lane.get())
+            try:
+                await asyncio.wait((getter,), timeout=self.idle_timeout)
+            except asyncio.CancelledError:
+                getter.cancel()
+                raise
+            if not getter.done():
+                # Отмененный get не забирает элемент из очереди
+                getter.cancel()
+                if lane.empty():
+                    # Чат неактивен - освобождаем его очередь
+                    del self.lanes[peer_id]
+                    del self.lane_tasks[peer_id]
+                    return
+                continue
+            update = getter.result()
+
+            try:
+                async with self.workers:
+                    await self.handle(update)
+            except Exception as e:
+                self.logger.error("Exception", exc_info=e)
+            finally:
+                lane.task_done()
+                self.pending_count -= 1
+                if self.pending is not None:
+                    self.pending.release()
+
+    async def handle(self, update: dict) -> None:
+        # Все обращения к БД при обработке обновления идут в одной транзакции.
+        # Изменения игр в памяти ставятся в очередь записи только после ее фиксации,
+        # при откате затронутые игры перечитываются из БД.
+        # Имена пользователей запрашиваются у VK и ответы отправляются уже после фиксации
+        with self.app.store.game.state.unit_of_work():
+            async with self.app.database.unit_of_work():
+                updates = await self.app.store.bots_manager.commands.handle(update)
+        updates = await self.app.store.bots_manager.commands.resolve_names(updates)
+        await self.app.store.bots_manager.handle_updates(updates)
+
+    async def stop(self) -> None:
+        for lane in list(self.lanes.values()):
+            await lane.join()
+        for task in self.lane_tasks.values():
+            task.cancel()
+        await asyncio.gather(*self.lane_tasks.values(), return_exceptions=True)
+        self.lanes.clear()
+        self.lane_tasks.clear()
@@ -1,30 +1,132 @@
+import os
+import threading
+import typing
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from multiprocessing import get_context
 from textwrap import wrap
 from io import BytesIO
+from typing import Optional
 
 from PIL import Image, ImageFont, ImageDraw
 
+if typing.TYPE_CHECKING:
+    from app.web.config import ImageConfig
 
-def get_img_to_send(img: Image) -> bytes:
-    """Преобразование Image в bytes"""
+MAIN_FONT_PATH = "assets/fonts/VelaSans-ExtraBold.ttf"
+NAME_FONT_PATH = "assets/fonts/VelaSans-SemiBold.ttf"
+IMAGES_DIR = "assets/images"
+# Увеличивается при любом изменении отрисовки, чтобы не отдавать из кэша картинки старого вида
+RENDER_VERSION = 1
+# Форматы, которые принимает загрузка фото VK
+CONTENT_TYPES = {"png": "image/png", "jpeg": "image/jpeg"}
+
+
+def get_img_to_send(img: Image, profile: Optional["ImageConfig"] = None) -> bytes:
+    """Преобразование Image в bytes по профилю кодирования, без профиля - полноцветный PNG"""
     bio = BytesIO()
-    img.save(bio, format="png")
-    bio.seek(0)
+    if profile is None:
+        img.save(bio, format="png")
+        return bio.getvalue()
+
+    if profile.max_width or profile.max_height:
+        img = img.copy()
+        img.thumbnail((profile.max_width or img.width, profile.max_height or img.height), Image.Resampling.LANCZOS)
+    if profile.format == "jpeg":
+        img.convert("RGB").save(bio, format="jpeg", quality=profile.quality, optimize=profile.optimize)
+    elif profile.format == "png":
+        if profile.colors:
+            # Для RGBA из методов квантования подходит только FASTOCTREE
+            img = img.quantize(colors=profile.colors, method=Image.Quantize.FASTOCTREE)
+        img.save(bio, format="png", optimize=profile.optimize)
+    else:
+        raise ValueError(f"Unsupported image format: {profile.format}")
     return bio.getvalue()
 
 
+class ImageRenderer:
+    """Отрисовка картинок: шрифты и фоны читаются с диска один раз, каждая картинка рисуется на копии фона"""
+
+    def __init__(
+            self,
+            main_font_path: str = MAIN_FONT_PATH,
+            name_font_path: str = NAME_FONT_PATH,
+            profile: Optional["ImageConfig"] = None
+    ):
+        self.main_font = ImageFont.truetype(main_font_path, size=24)
+        self.name_font = ImageFont.truetype(name_font_path, size=16)
+        self.profile = profile
+        self.backgrounds: dict[str, Image.Image] = {}
+
+    def preload(self, directory: str = IMAGES_DIR) -> None:
+        for name in sorted(os.listdir(directory)):
+            if name.endswith(".png"):
+                self.get_background(os.path.join(directory, name))
+
+    def get_background(self, image_path: str) -> Image.Image:
+        background = self.backgrounds.get(image_path)
+        if background is None:
+            with Image.open(image_path) as img:
+                # Декодируем сразу, иначе Image.open отложит чтение до первого обращения к пикселям
+                img.load()
+                background = img.copy()
+            self.backgrounds[image_path] = background
+        return background
+
+    def render(self, image_path: str, text: str, author_name: str = None) -> bytes:
+        """Создание картинки"""
+        img = self.get_background(image_path).copy()
+        draw = ImageDraw.Draw(img)
+
+        if author_name is not None:
+            draw.text((40, 20), text=f"Автор вопроса: {author_name}", font=self.name_font, fill="#858362")
+
+        offset = 200
+        for line in wrap(text, width=40):
+            draw.text((310, offset), line, font=self.main_font, fill="#F7F6A8", anchor="mm")
+            offset += 30
+
+        return get_img_to_send(img, self.profile)
+
+
+_default_renderer: Optional[ImageRenderer] = None
+
+
 def create_image(image_path: str, text: str, author_name: str = None) -> bytes:
-    """Создание картинки"""
-    background_img = Image.open(image_path)
-    draw = ImageDraw.Draw(background_img)
-    main_font = ImageFont.truetype("assets/fonts/VelaSans-ExtraBold.ttf", size=24)
+    """Создание картинки общим экземпляром ImageRenderer"""
+    global _default_renderer
+    if _default_renderer is None:
+        _default_renderer = ImageRenderer()
+    return _default_renderer.render(image_path, text, author_name)
+
+
+# Рендерер процесса или потока пула отрисовки
+_worker = threading.local()
+
+
+def init_worker(directory: str = IMAGES_DIR, profile: Optional["ImageConfig"] = None) -> None:
+    """Прогрев исполнителя пула: шрифты и фоны загружаются до первой отрисовки"""
+    _worker.renderer = ImageRenderer(profile=profile)
+    _worker.renderer.preload(directory)
+
 
-    if author_name is not None:
-        name_font = ImageFont.truetype("assets/fonts/VelaSans-SemiBold.ttf", size=16)
-        draw.text((40, 20), text=f"Автор вопроса: {author_name}", font=name_font, fill="#858362")
+def render_in_worker(image_path: str, text: str, author_name: str = None) -> bytes:
+    if getattr(_worker, "renderer", None) is None:
+        init_worker()
+    return _worker.renderer.render(image_path, text, author_name)
 
-    offset = 200
-    for line in wrap(text, width=40):
-        draw.text((310, offset), line, font=main_font, fill="#F7F6A8", anchor="mm")
-        offset += 30
 
-    return get_img_to_send(background_img)
+def create_render_executor(
+        kind: str, workers: Optional[int] = None, profile: Optional["ImageConfig"] = None
+) -> Optional[Executor]:
+    """Пул отрисовки: process, thread или none - рисовать прямо в цикле событий"""
+    initargs = (IMAGES_DIR, profile)
+    if kind == "process":
+        # spawn, а не fork: дочерние процессы не наследуют цикл событий и соединения с БД
+        return ProcessPoolExecutor(
+            workers, mp_context=get_context("spawn"), initializer=init_worker, initargs=initargs
+        )
+    if kind == "thread":
+        return ThreadPoolExecutor(workers, thread_name_prefix="render", initializer=init_worker, initargs=initargs)
+    if kind == "none":
+        return None
+    raise ValueError(f"Unknown render executor: {kind}")
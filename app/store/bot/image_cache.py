@@ -0,0 +1,122 @@
+import asyncio
+import os
+from concurrent.futures import Executor
+from dataclasses import astuple
+from hashlib import sha256
+from logging import getLogger
+from typing import Optional
+
+from app.base.lru_cache import LRUCache
+from app.store.bot.image_app import MAIN_FONT_PATH, NAME_FONT_PATH, RENDER_VERSION, ImageRenderer, render_in_worker
+
+
+class ImageCache:
+    """Кэш отрисованных картинок: LRU в памяти и необязательный каталог на диске с файлами по хэшу ключа"""
+
+    def __init__(
+            self,
+            maxsize: int,
+            directory: Optional[str] = None,
+            renderer: Optional[ImageRenderer] = None,
+            executor: Optional[Executor] = None
+    ):
+        self.logger = getLogger("image_cache")
+        self.renderer = renderer or ImageRenderer()
+        # Пул для отрисовки вне цикла событий; без него рисуем в текущем потоке
+        self.executor = executor
+        self._rendering: dict[tuple, asyncio.Future] = {}
+        self.memory = LRUCache(maxsize)
+        self.directory = directory
+        self.disk_hits = 0
+        self.renders = 0
+
+    def make_key(self, image_path: str, text: str, author_name: Optional[str]) -> tuple:
+        profile = astuple(self.renderer.profile) if self.renderer.profile is not None else None
+        return image_path, text, author_name, MAIN_FONT_PATH, NAME_FONT_PATH, RENDER_VERSION, profile
+
+    def _disk_path(self, key: tuple) -> str:
+        digest = sha256(repr(key).encode()).hexdigest()
+        extension = self.renderer.profile.format if self.renderer.profile is not None else "png"
+        return os.path.join(self.directory, digest[:2], f"{digest}.{extension}")
+
+    def _read_disk(self, key: tuple) -> Optional[bytes]:
+        try:
+            with open(self._disk_path(key), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def _write_disk(self, key: tuple, image: bytes) -> None:
+        path = self._disk_path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Запись во временный файл и переименование: читатели не увидят недописанный файл
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(image)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            self.logger.warning(f"Не удалось сохранить картинку в кэш: {e}")
+
+    async def _run_io(self, func, *args):
+        # Файлы картинок до сотен КБ читаются и пишутся в пуле потоков по умолчанию, не блокируя цикл событий.
+        # Пул отрисовки для этого не подходит: процессам не передать методы кэша
+        return await asyncio.get_running_loop().run_in_executor(None, func, *args)
+
+    async def get(self, image_path: str, text: str, author_name: Optional[str] = None) -> Optional[bytes]:
+        key = self.make_key(image_path, text, author_name)
+        image = self.memory.get(key)
+        if image is None and self.directory is not None:
+            image = await self._run_io(self._read_disk, key)
+            if image is not None:
+                self.disk_hits += 1
+                self.memory.set(key, image)
+        return image
+
+    async def set(self, image_path: str, text: str, author_name: Optional[str], image: bytes) -> None:
+        key = self.make_key(image_path, text, author_name)
+        self.memory.set(key, image)
+        if self.directory is not None:
+            await self._run_io(self._write_disk, key, image)
+
+    async def render(self, image_path: str, text: str, author_name: Optional[str] = None) -> bytes:
+        image = await self.get(image_path, text, author_name)
+        if image is not None:
+            return image
+        key = self.make_key(image_path, text, author_name)
+        # Одну и ту же картинку, запрошенную из нескольких чатов одновременно, рисуем один раз
+        future = self._rendering.get(key)
+        if future is None:
+            future = self._rendering[key] = asyncio.ensure_future(self._render(image_path, text, author_name))
+            future.add_done_callback(lambda _: self._rendering.pop(key, None))
+        return await asyncio.shield(future)
+
+    async def _render(self, image_path: str, text: str, author_name: Optional[str]) -> bytes:
+        if self.executor is None:
+            image = self.renderer.render(image_path, text, author_name)
+        else:
+            image = await asyncio.get_running_loop().run_in_executor(
+                self.executor, render_in_worker, image_path, text, author_name
+            )
+        self.renders += 1
+        await self.set(image_path, text, author_name, image)
+        return image
+
+    async def warm_up(self, workers: int) -> None:
+        """Запуск исполнителей пула заранее, чтобы первые картинки не ждали загрузки шрифтов и фонов"""
+        if self.executor is not None:
+            loop = asyncio.get_running_loop()
+            await asyncio.gather(*(loop.run_in_executor(self.executor, os.getpid) for _ in range(workers)))
+
+    def close(self) -> None:
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> dict:
+        requests = self.memory.hits + self.memory.misses
+        return {
+            "memory": self.memory.stats(),
+            "disk_hits": self.disk_hits,
+            "renders": self.renders,
+            "hit_rate": (requests - self.renders) / requests if requests else 0.0,
+        }
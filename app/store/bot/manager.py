@@ -2,22 +2,46 @@ import typing
 from random import randint
 from logging import getLogger
 
+from app.store.bot.commands import GameCommands
+from app.store.bot.dispatcher import UpdateDispatcher
 from app.store.bot.image_app import create_image
-from app.store.vk_api.dataclasses import Update, Message, Keyboard, Button, Action
+from app.store.bot.outbox import Outbox
+from app.store.vk_api.dataclasses import Update, Message, Keyboard, Button, Action, Priority
 
 if typing.TYPE_CHECKING:
     from app.web.app import Application
 
+PRIORITIES = {
+    "capitan_chosen": Priority.HIGH,
+    "players_answer": Priority.HIGH,
+    "get_answer": Priority.HIGH,
+    "get_question": Priority.HIGH,
+    "players_ready": Priority.HIGH,
+    "finished": Priority.HIGH,
+    "invite_bot": Priority.LOW,
+    "join_game": Priority.LOW,
+    "try_join_game": Priority.LOW,
+}
+
 
 class BotManager:
     def __init__(self, app: "Application"):
         self.app = app
         self.bot = None
         self.logger = getLogger("handler")
+        self.dispatcher = UpdateDispatcher(
+            app,
+            workers=app.config.bot.workers,
+            queue_size=app.config.bot.queue_size,
+            idle_timeout=app.config.bot.lane_idle_timeout
+        )
+        self.commands = GameCommands(app)
+        self.outbox = Outbox(app, window=app.config.bot.outbox_window)
 
     async def handle_updates(self, updates: list[Update]):
         for update in updates:
             keyboard = None
+            priority = PRIORITIES.get(update.object.event_type, Priority.NORMAL)
 
             if update.object.event_type in ("start_game", "join_game"):
                 keyboard = Keyboard(
@@ -38,45 +62,50 @@ class BotManager:
             if update.object.event_type in (
                     "invite_bot", "start_game", "join_game", "try_join_game",
                     "try_start_game", "try_players_ready", "players_answer",
-                    "tag_user", "finished"
+                    "tag_user", "capitan_chosen", "finished"
             ):
                 msg = update.object.body
-                await self.app.store.vk_api.send_message(
+                self.outbox.put(
                     Message(
                         peer_id=update.object.peer_id,
                         text=msg,
                         keyboard=keyboard,
-                        attachment=None
+                        attachment=None,
+                        priority=priority
                     )
                 )
             elif update.object.event_type == "get_answer":
-                photo = await self.app.store.vk_api.get_photo(
+                attachment, image = await self.app.store.vk_api.get_photo(
                     update=update,
                     image_path=f"assets/images/answer{randint(1, 3)}.png"
                 )
 
-                await self.app.store.vk_api.send_message(
+                self.outbox.put(
                     Message(
                         peer_id=update.object.peer_id,
                         text="",
                         keyboard=keyboard,
-                        attachment=f"photo{photo['owner_id']}_{photo['id']}"
+                        attachment=attachment,
+                        priority=priority,
+                        photos={attachment: image}
                     )
                 )
 
             elif update.object.event_type in ("get_question", "players_ready"):
-                photo = await self.app.store.vk_api.get_photo(
+                attachment, image = await self.app.store.vk_api.get_photo(
                     update=update,
                     image_path=f"assets/images/question.png"
                 )
-                await self.app.store.vk_api.send_message(
+                self.outbox.put(
                     Message(
                         peer_id=update.object.peer_id,
-                        text="❓ Внимание! Вопрос!%0A%0A"
+                        text="❓ Внимание! Вопрос!\n\n"
                              "❗ У вас есть 1 минута на обсуждение и 30 секунд на ответ. " 
-                             "Отвечает игрок, которого выберет капитан%0A%0A"
+                             "Отвечает игрок, которого выберет капитан\n\n"
                              "💬 Формат ответа: /answer <ответ>",
                         keyboard=keyboard,
-                        attachment=f"photo{photo['owner_id']}_{photo['id']}"
+                        attachment=attachment,
+                        priority=priority,
+                        photos={attachment: image}
                     )
                 )
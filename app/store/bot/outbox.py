@@ -0,0 +1,83 @@
+import asyncio
+import typing
+from functools import partial
+from logging import getLogger
+from typing import Optional
+
+from app.store.vk_api.dataclasses import Message
+
+if typing.TYPE_CHECKING:
+    from app.web.app import Application
+
+# Ограничения messages.send
+MAX_ATTACHMENTS = 10
+MAX_TEXT_LENGTH = 4096
+
+
+class Outbox:
+    """Буфер исходящих сообщений по чатам: подряд идущие сообщения склеиваются в один вызов messages.send"""
+
+    def __init__(self, app: "Application", window: float = 0):
+        self.app = app
+        self.logger = getLogger("outbox")
+        self.window = window
+        self._buffers: dict[int, list[Message]] = {}
+        self._flush_handles: dict[int, asyncio.TimerHandle] = {}
+        self._flush_tasks: dict[int, asyncio.Task] = {}
+
+    def put(self, message: Message) -> None:
+        buffer = self._buffers.setdefault(message.peer_id, [])
+        if not buffer or not self._merge(buffer[-1], message):
+            buffer.append(message)
+        if message.peer_id not in self._flush_handles:
+            self._flush_handles[message.peer_id] = asyncio.get_running_loop().call_later(
+                self.window, self._schedule_flush, message.peer_id
+            )
+
+    @staticmethod
+    def _merge(prev: Message, message: Message) -> bool:
+        # Во VK вложения показываются под текстом, поэтому текст после вложения склеивать нельзя
+        if prev.attachment and message.text:
+            return False
+        if prev.keyboard is not None and message.keyboard is not None and prev.keyboard != message.keyboard:
+            return False
+        attachments = [a for a in (prev.attachment, message.attachment) if a]
+        if sum(len(a.split(",")) for a in attachments) > MAX_ATTACHMENTS:
+            return False
+        text = "\n\n".join(t for t in (prev.text, message.text) if t)
+        if len(text) > MAX_TEXT_LENGTH:
+            return False
+
+        prev.text = text
+        prev.attachment = ",".join(attachments) or None
+        prev.keyboard = prev.keyboard or message.keyboard
+        prev.priority = min(prev.priority, message.priority)
+        prev.photos.update(message.photos)
+        return True
+
+    def _schedule_flush(self, peer_id: int) -> None:
+        self._flush_handles.pop(peer_id, None)
+        messages = self._buffers.pop(peer_id, [])
+        previous = self._flush_tasks.get(peer_id)
+        task = self._flush_tasks[peer_id] = asyncio.create_task(self._send(messages, previous))
+        task.add_done_callback(partial(self._forget_task, peer_id))
+
+    def _forget_task(self, peer_id: int, task: asyncio.Task) -> None:
+        if self._flush_tasks.get(peer_id) is task:
+            del self._flush_tasks[peer_id]
+
+    async def _send(self, messages: list[Message], previous: Optional[asyncio.Task]) -> None:
+        # Отправка в чат идет строго после предыдущей пачки, чтобы сохранить порядок сообщений
+        if previous is not None:
+            await asyncio.gather(previous, return_exceptions=True)
+        for message in messages:
+            try:
+                await self.app.store.vk_api.send_message(message)
+            except Exception as e:
+                self.logger.error("Exception", exc_info=e)
+
+    async def close(self) -> None:
+        for peer_id, handle in list(self._flush_handles.items()):
+            handle.cancel()
+            self._schedule_flush(peer_id)
+        await asyncio.gather(*self._flush_tasks.values(), return_exceptions=True)
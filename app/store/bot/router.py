@@ -0,0 +1,113 @@
+import re
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Optional
+
+from app.store.vk_api.dataclasses import Update, UpdateObject
+
+# Обращение к участнику беседы: [id123|Имя]
+MENTION_RE = re.compile(r"\[id(\d+)\|.+]")
+# Первые символы сообщений, которые могут быть командами
+COMMAND_PREFIXES = frozenset("/[")
+# Подстановка имени пользователя, заменяемая после фиксации транзакции
+USER_NAME_RE = re.compile(r"\x1fname:(\d+)\x1f")
+
+
+def user_name(vk_id: int) -> str:
+    return f"\x1fname:{vk_id}\x1f"
+
+
+def user_mention(vk_id: int) -> str:
+    return f"[id{vk_id}|{user_name(vk_id)}]"
+
+
+@dataclass
+class CommandContext:
+    update_type: str
+    message_id: int
+    peer_id: int
+    from_id: int
+    text: str
+    args: str
+    message: dict
+
+    def reply(self, body: str, event_type: str) -> Update:
+        return Update(
+            type=self.update_type,
+            object=UpdateObject(
+                id=self.message_id,
+                user_id=self.from_id,
+                peer_id=self.peer_id,
+                body=body,
+                event_type=event_type
+            )
+        )
+
+
+Handler = Callable[[CommandContext], Awaitable[list[Update]]]
+
+
+class CommandRouter:
+    """Реестр обработчиков команд чата с выбором обработчика за O(1)"""
+
+    def __init__(self):
+        self.commands: dict[str, tuple[Handler, bool]] = {}
+        self.actions: dict[str, Handler] = {}
+        self.payloads: dict[str, Handler] = {}
+        self.mention_handler: Optional[Handler] = None
+
+    def add_command(self, name: str, handler: Handler, with_args: bool = False) -> None:
+        self.commands[name] = (handler, with_args)
+
+    def add_action(self, action_type: str, handler: Handler) -> None:
+        self.actions[action_type] = handler
+
+    def add_payload(self, payload: str, handler: Handler) -> None:
+        self.payloads[payload] = handler
+
+    def add_mention(self, handler: Handler) -> None:
+        self.mention_handler = handler
+
+    def resolve(self, message: dict) -> tuple[Optional[Handler], str]:
+        if (action := message.get("action")) is not None:
+            return self.actions.get(action["type"]), ""
+        if (payload := message.get("payload")) is not None and payload in self.payloads:
+            return self.payloads[payload], ""
+
+        text = message["text"]
+        # Обычная переписка в чате отсекается до обращения к БД и VK
+        if not text or text[0] not in COMMAND_PREFIXES:
+            return None, ""
+        if text[0] == "[":
+            return (self.mention_handler, "") if MENTION_RE.fullmatch(text) else (None, "")
+
+        name, _, args = text.partition(" ")
+        command = self.commands.get(name)
+        if command is None:
+            return None, ""
+        handler, with_args = command
+        if with_args != bool(args):
+            return None, ""
+        return handler, args
+
+    async def route(self, update: dict) -> list[Update]:
+        if update["type"] != "message_new":
+            return []
+        message = update["object"]["message"]
+        # Личные сообщения боту не обрабатываются
+        if message["peer_id"] == message["from_id"]:
+            return []
+
+        handler, args = self.resolve(message)
+        if handler is None:
+            return []
+        return await handler(
+            CommandContext(
+                update_type=update["type"],
+                message_id=message["id"],
+                peer_id=message["peer_id"],
+                from_id=message["from_id"],
+                text=message["text"],
+                args=args,
+                message=message
+            )
+        )
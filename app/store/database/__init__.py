@@ -1,2 +1,3 @@
 from app.admin.models import *
 from app.game.models import *
+from app.bot.models import *
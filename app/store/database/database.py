@@ -1,7 +1,12 @@
-from typing import Optional, TYPE_CHECKING
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from time import perf_counter
+from typing import AsyncIterator, Optional, TYPE_CHECKING
 
+from sqlalchemy import event
 from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, create_async_engine
 from sqlalchemy.orm import declarative_base, sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 
 from app.store.database import db
 
@@ -9,6 +14,49 @@ if TYPE_CHECKING:
     from app.web.app import Application
 
 
+# Сессия единицы работы, открытой в текущей задаче
+current_session: ContextVar[Optional[AsyncSession]] = ContextVar("current_session", default=None)
+
+
+class StatsQueuePool(AsyncAdaptedQueuePool):
+    """Пул соединений, замеряющий время ожидания свободного соединения"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.checkouts = 0
+        self.connects = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        event.listen(self, "checkout", self._on_checkout)
+        event.listen(self, "connect", self._on_connect)
+
+    def _do_get(self):
+        started_at = perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            wait = perf_counter() - started_at
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+
+    def _on_checkout(self, *_) -> None:
+        self.checkouts += 1
+
+    def _on_connect(self, *_) -> None:
+        self.connects += 1
+
+    def stats(self) -> dict:
+        return {
+            "size": self.size(),
+            "checked_out": self.checkedout(),
+            "overflow": self.overflow(),
+            "checkouts": self.checkouts,
+            "connects": self.connects,
+            "avg_wait": self.total_wait / self.checkouts if self.checkouts else 0.0,
+            "max_wait": self.max_wait,
+        }
+
+
 class Database:
     def __init__(self, app: "Application"):
         self.app = app
@@ -18,11 +66,21 @@ class Database:
 
     async def connect(self, *_, **__) -> None:
         self._db = db
+        config = self.app.config.database
+        connect_args = {"prepared_statement_cache_size": config.statement_cache_size}
+        if config.command_timeout:
+            connect_args["command_timeout"] = config.command_timeout
         self._engine = create_async_engine(
-            f"postgresql+asyncpg://{self.app.config.database.user}:{self.app.config.database.password}"
-            f"@{self.app.config.database.host}/{self.app.config.database.database}",
-            echo=True,
-            future=True
+            config.url,
+            echo=config.echo,
+            future=True,
+            poolclass=StatsQueuePool,
+            pool_size=config.pool_size,
+            max_overflow=config.max_overflow,
+            pool_timeout=config.pool_timeout,
+            pool_pre_ping=config.pool_pre_ping,
+            pool_recycle=config.pool_recycle,
+            connect_args=connect_args
         )
         self.session = sessionmaker(
             self._engine,
@@ -30,8 +88,35 @@ class Database:
             class_=AsyncSession
         )
 
+    def pool_stats(self) -> dict:
+        return self._engine.pool.stats()
+
     async def disconnect(self, *_, **__) -> None:
         try:
             await self._engine.dispose()
         except Exception:
             pass
+
+    @asynccontextmanager
+    async def unit_of_work(self) -> AsyncIterator[AsyncSession]:
+        """Одна сессия и транзакция на всю обработку: фиксируется в конце, при ошибке откатывается"""
+        if current_session.get() is not None:
+            async with self.transaction() as session:
+                yield session
+            return
+        async with self.session.begin() as session:
+            token = current_session.set(session)
+            try:
+                yield session
+            finally:
+                current_session.reset(token)
+
+    @asynccontextmanager
+    async def transaction(self) -> AsyncIterator[AsyncSession]:
+        """Сессия открытой единицы работы, а вне ее - отдельная транзакция"""
+        session = current_session.get()
+        if session is not None:
+            yield session
+            return
+        async with self.session.begin() as session:
+            yield session
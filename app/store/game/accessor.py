@@ -1,18 +1,49 @@
+import typing
 from datetime import datetime
-from random import shuffle
-from typing import Optional
+from random import choice, sample
+from typing import AsyncIterator, Optional
 
-from sqlalchemy import select, update, delete, and_
+from sqlalchemy import select, update, delete, and_, or_
 from sqlalchemy.dialects.postgresql import insert
-from sqlalchemy.orm import joinedload, subqueryload
-from sqlalchemy.sql.expression import func
+from sqlalchemy.orm import joinedload, noload, selectinload
+from sqlalchemy.sql import Select
 
 from app.game.dataclasses import Question, Answer, Game, User, Chat
 from app.game.models import QuestionModel, AnswerModel, GameModel, UserModel, ChatModel, games_users, games_questions
 from app.base.base_accessor import BaseAccessor
+from app.base.lru_cache import LRUCache
+from app.store.game.question_bank import QuestionBank
+from app.store.game.state import GameStateStore, active_games_query, game_from_model, game_from_row
+
+if typing.TYPE_CHECKING:
+    from app.web.app import Application
+
+# Число строк, читаемых из курсора за раз при выгрузке
+EXPORT_BATCH_SIZE = 500
+WINNING_SCORE = 6
+# Игра длится не больше 2 * WINNING_SCORE - 1 вопросов
+DECK_SIZE = 2 * WINNING_SCORE - 1
 
 
 class GameAccessor(BaseAccessor):
+    def __init__(self, app: "Application", *args, **kwargs):
+        super().__init__(app, *args, **kwargs)
+        self.state = GameStateStore(app, flush_interval=app.config.game.flush_interval)
+        self.chat_ids = LRUCache(maxsize=app.config.game.chat_cache_size)
+        self.question_bank = QuestionBank(
+            stemming=app.config.game.answer_stemming,
+            max_distance=app.config.game.answer_max_distance
+        )
+
+    async def connect(self, app: "Application"):
+        await self.load_question_bank()
+        await self.state.hydrate()
+        for vk_chat_id, game in self.state.games.items():
+            self.chat_ids.set(vk_chat_id, game.chat_id)
+
+    async def disconnect(self, app: "Application"):
+        await self.state.flush()
+
     async def create_question(
             self, title: str, answer_desc: str, answers: list[Answer], author_id: Optional[str], is_approved: bool
     ) -> Question | None:
@@ -28,10 +59,14 @@ class GameAccessor(BaseAccessor):
                 for answer in answers
             ]
         )
-        async with self.app.database.session.begin() as session:
+        async with self.app.database.transaction() as session:
             session.add(new_question)
+            await session.flush()
 
-        return new_question.to_dc()
+        question = new_question.to_dc()
+        if question.is_approved and self.question_bank.is_loaded:
+            self.question_bank.add(question)
+        return question
 
     async def create_answers(self, question_id: int, answers: list[Answer]) -> list[Answer]:
         new_answers = [
@@ -41,14 +76,14 @@ class GameAccessor(BaseAccessor):
             )
             for answer in answers
         ]
-        async with self.app.database.session() as session:
+        async with self.app.database.transaction() as session:
             session.add_all(new_answers)
-            await session.commit()
+            await session.flush()
 
         return [answer.to_dc() for answer in new_answers]
 
     async def get_question_by_title(self, title: str) -> Question | None:
-        async with self.app.database.session() as session:
+        async with self.app.database.transaction() as session:
             result = await session.execute(
                 select(QuestionModel)
                 .where(QuestionModel.title == title)
@@ -62,7 +97,7 @@ class GameAccessor(BaseAccessor):
         return obj.to_dc()
 
     async def get_question_by_id(self, id_: int) -> Question | None:
-        async with self.app.database.session() as session:
+        async with self.app.database.transaction() as session:
             result = await session.execute(
                 select(QuestionModel)
                 .where(QuestionModel.id == id_)
@@ -75,41 +110,85 @@ class GameAccessor(BaseAccessor):
 
             return obj.to_dc()
 
-    async def get_questions_list(self, question_id: int, is_approved: bool) -> list[Question] | None:
+    @staticmethod
+    def _paginate(query: Select, model, limit: int = None, after: int = None) -> Select:
+        """Keyset-пагинация по id: limit записей с id больше after"""
+        if after is not None:
+            query = query.where(model.id > after)
+        if limit is not None or after is not None:
+            query = query.order_by(model.id)
+        if limit is not None:
+            query = query.limit(limit)
+        return query
+
+    async def get_questions_list(
+            self,
+            question_id: int,
+            is_approved: bool,
+            limit: int = None,
+            after: int = None,
+            with_answers: bool = True
+    ) -> list[Question] | None:
         query = select(QuestionModel)
         if question_id:
             query = query.where(QuestionModel.id == int(question_id))
         if is_approved:
             is_approved = True if is_approved == "true" else False
             query = query.where(QuestionModel.is_approved == is_approved)
-        async with self.app.database.session() as session:
-            result = await session.execute(
-                query.options(joinedload(QuestionModel.answers))
-            )
-        question_list = [question.to_dc() for question in result.scalars().unique().all()]
+        # selectinload вместо joinedload, чтобы LIMIT применялся к вопросам, а не к строкам с ответами
+        query = self._paginate(query, QuestionModel, limit, after).options(
+            selectinload(QuestionModel.answers) if with_answers else noload(QuestionModel.answers)
+        )
+        async with self.app.database.transaction() as session:
+            result = await session.execute(query)
+        question_list = [question.to_dc() for question in result.scalars().all()]
         return question_list
 
     async def approve_question(self, id_: int) -> None:
-        async with self.app.database.session.begin() as session:
+        async with self.app.database.transaction() as session:
             await session.execute(
                 update(QuestionModel)
                 .where(QuestionModel.id == id_)
                 .values(is_approved=True)
             )
+        if self.question_bank.is_loaded:
+            question = await self.get_question_by_id(id_)
+            if question is not None:
+                self.question_bank.add(question)
 
     async def delete_question(self, id_: int) -> None:
-        async with self.app.database.session.begin() as session:
+        async with self.app.database.transaction() as session:
             await session.execute(
                 delete(QuestionModel)
                 .where(QuestionModel.id == id_)
             )
+        self.question_bank.remove(id_)
+
+    async def load_question_bank(self) -> None:
+        async with self.app.database.transaction() as session:
+            result = await session.execute(
+                select(QuestionModel)
+                .where(QuestionModel.is_approved == True)
+                .options(selectinload(QuestionModel.answers))
+            )
+        self.question_bank.load([question.to_dc() for question in result.scalars().all()])
+        self.logger.info(f"Загружено одобренных вопросов: {len(self.question_bank)}")
+
+    async def get_question_bank(self) -> QuestionBank:
+        if not self.question_bank.is_loaded:
+            await self.load_question_bank()
+        return self.question_bank
 
     async def get_games_list(
             self,
             game_id: int = None,
             chat_id: int = None,
             is_started: bool = None,
-            is_finished: bool = None
+            is_finished: bool = None,
+            limit: int = None,
+            after: int = None,
+            with_players: bool = True,
+            with_questions: bool = True
     ) -> list[Game] | None:
         query = select(GameModel)
         if game_id:
@@ -120,84 +199,173 @@ class GameAccessor(BaseAccessor):
             query = query.where(GameModel.is_started == is_started)
         if is_finished is not None:
             query = query.where(GameModel.is_finished == is_finished)
-        async with self.app.database.session() as session:
-            result = await session.execute(
-                query
-                .options(joinedload(GameModel.players))
-                .options(joinedload(GameModel.questions))
-                .options(subqueryload(GameModel.questions, QuestionModel.answers))
-            )
+        query = self._paginate(query, GameModel, limit, after).options(
+            selectinload(GameModel.players) if with_players else noload(GameModel.players),
+            selectinload(GameModel.questions).selectinload(QuestionModel.answers)
+            if with_questions else noload(GameModel.questions)
+        )
+        async with self.app.database.transaction() as session:
+            result = await session.execute(query)
 
-        games_list = [game.to_dc() for game in result.scalars().unique().all()]
+        games_list = [game.to_dc() for game in result.scalars().all()]
         return games_list
 
-    async def get_users_list(self, user_id: int = None, vk_user_id: int = None) -> list[User] | None:
+    async def _stream(self, query: Select, batch_size: int) -> AsyncIterator[list]:
+        """Чтение query серверным курсором пачками по batch_size, память не зависит от размера таблицы"""
+        async with self.app.database.session() as session:
+            result = await session.stream(query.execution_options(yield_per=batch_size))
+            async for partition in result.scalars().partitions(batch_size):
+                # identity map хранит объекты по слабым ссылкам, отданные пачки освобождаются
+                yield [obj.to_dc() for obj in partition]
+
+    def stream_questions(self, batch_size: int = EXPORT_BATCH_SIZE) -> AsyncIterator[list[Question]]:
+        return self._stream(
+            select(QuestionModel).order_by(QuestionModel.id).options(selectinload(QuestionModel.answers)),
+            batch_size
+        )
+
+    def stream_games(self, batch_size: int = EXPORT_BATCH_SIZE) -> AsyncIterator[list[Game]]:
+        return self._stream(
+            select(GameModel).order_by(GameModel.id).options(
+                selectinload(GameModel.players),
+                selectinload(GameModel.questions).selectinload(QuestionModel.answers)
+            ),
+            batch_size
+        )
+
+    async def get_users_list(
+            self, user_id: int = None, vk_user_id: int = None, limit: int = None, after: int = None
+    ) -> list[User] | None:
         query = select(UserModel)
         if user_id:
             query = query.where(UserModel.id == int(user_id))
         if vk_user_id:
             query = query.where(UserModel.vk_id == int(vk_user_id))
-        async with self.app.database.session() as session:
+        async with self.app.database.transaction() as session:
             result = await session.execute(
-                query
+                self._paginate(query, UserModel, limit, after)
             )
         users_list = [user.to_dc() for user in result.scalars().all()]
         return users_list
 
-    async def get_chats_list(self, chat_id: int = None, vk_id: int = None) -> list[Chat] | None:
+    async def get_chats_list(
+            self, chat_id: int = None, vk_id: int = None, limit: int = None, after: int = None
+    ) -> list[Chat] | None:
         query = select(ChatModel)
         if chat_id:
             query = query.where(ChatModel.id == int(chat_id))
         if vk_id:
             query = query.where(ChatModel.vk_id == int(vk_id))
-        async with self.app.database.session() as session:
+        async with self.app.database.transaction() as session:
             result = await session.execute(
-                query
+                self._paginate(query, ChatModel, limit, after)
             )
         chats_list = [chat.to_dc() for chat in result.scalars().all()]
         return chats_list
 
     async def add_new_chat(self, vk_chat_id: int) -> Chat | None:
-        new_chat = ChatModel(vk_id=vk_chat_id)
         insert_stmt = insert(ChatModel).values(vk_id=vk_chat_id)
-        do_nothing_stm = insert_stmt.on_conflict_do_nothing(index_elements=["vk_id"])
-        async with self.app.database.session.begin() as session:
-            await session.execute(do_nothing_stm)
-        return new_chat.to_dc()
-
-    async def create_new_game(self, chat_id: int) -> None:
-        chat: Chat = (await self.get_chats_list(vk_id=chat_id))[0]
-        new_game = GameModel(chat_id=chat.id)
-        async with self.app.database.session.begin() as session:
+        # DO UPDATE вместо DO NOTHING, чтобы RETURNING вернул id и для уже существующего чата
+        upsert_stmt = insert_stmt.on_conflict_do_update(
+            index_elements=["vk_id"],
+            set_={"vk_id": insert_stmt.excluded.vk_id}
+        ).returning(ChatModel.id)
+        async with self.app.database.transaction() as session:
+            chat_id = (await session.execute(upsert_stmt)).scalar_one()
+        self.chat_ids.set(vk_chat_id, chat_id)
+        return Chat(id=chat_id, vk_id=vk_chat_id)
+
+    async def get_chat_id(self, vk_chat_id: int) -> int | None:
+        """id чата в БД по его vk_id; соответствие не меняется, поэтому кэшируется"""
+        chat_id = self.chat_ids.get(vk_chat_id)
+        if chat_id is None:
+            chats = await self.get_chats_list(vk_id=vk_chat_id)
+            if not chats:
+                return
+            chat_id = chats[0].id
+            self.chat_ids.set(vk_chat_id, chat_id)
+        return chat_id
+
+    async def create_new_game(self, chat_id: int) -> Game:
+        new_game = GameModel(
+            chat_id=await self.get_chat_id(chat_id),
+            bot_score=0,
+            players_score=0,
+            is_started=False,
+            is_finished=False,
+            players=[],
+            questions=[]
+        )
+        async with self.app.database.transaction() as session:
             session.add(new_game)
+            await session.flush()
+        game = game_from_model(new_game)
+        self.state.set(chat_id, game)
+        return game
 
     async def add_new_user(self, vk_id: int) -> User | None:
         new_user = UserModel(vk_id=vk_id)
         insert_stmt = insert(UserModel).values(vk_id=vk_id)
         do_nothing_stm = insert_stmt.on_conflict_do_nothing(index_elements=["vk_id"])
-        async with self.app.database.session.begin() as session:
+        async with self.app.database.transaction() as session:
             await session.execute(do_nothing_stm)
         return new_user.to_dc()
 
     async def get_game_by_vk_id(self, vk_chat_id: int, is_started: bool = None,
                                 is_finished: bool = None) -> Game | None:
-        chat: Chat = (await self.get_chats_list(vk_id=vk_chat_id))[0]
-        game: list[Game] | None = await self.get_games_list(
-            chat_id=chat.id,
-            is_started=is_started,
-            is_finished=is_finished
-        )
-        if game:
-            return game[0]
+        if is_finished is not False:
+            game: list[Game] | None = await self.get_games_list(
+                chat_id=await self.get_chat_id(vk_chat_id),
+                is_started=is_started,
+                is_finished=is_finished
+            )
+            if game:
+                return game[0]
+            return
+
+        # Активные игры читаются из памяти, в БД обращаемся только для еще не загруженных чатов
+        if vk_chat_id not in self.state:
+            self.state.set(vk_chat_id, await self.get_active_game(vk_chat_id))
+        game = self.state.get(vk_chat_id)
+        if game is not None and (is_started is None or game.is_started == is_started):
+            return game
+
+    async def get_active_game(self, vk_chat_id: int) -> Game | None:
+        game = await self._read_active_game(vk_chat_id)
+        if game is not None:
+            await self._apply_pending(game)
+        return game
+
+    async def _read_active_game(self, vk_chat_id: int) -> Game | None:
+        async with self.app.database.transaction() as session:
+            result = await session.execute(
+                active_games_query().where(ChatModel.vk_id == vk_chat_id)
+            )
+        row = result.first()
+        if row is not None:
+            return game_from_row(row)
+
+    async def _apply_pending(self, game: Game) -> None:
+        """Наложение на прочитанную из БД игру изменений, которые еще ждут отложенной записи"""
+        rows, values = self.state.pending(game.id)
+        for key, value in values.items():
+            setattr(game, key, value)
+        for table, row in rows:
+            if table is games_users and self._get_player(game, user_id=row["user_id"]) is None:
+                game.players.extend(await self.get_users_list(user_id=row["user_id"]))
+            elif table is games_questions and row["question_id"] not in {question.id for question in game.questions}:
+                question = (await self.get_question_bank()).get(row["question_id"])
+                if question is None:
+                    question = await self.get_question_by_id(row["question_id"])
+                if question is not None:
+                    game.questions.append(question)
 
     async def add_new_player(self, vk_user_id: int, vk_chat_id: int) -> User | None:
         game: Game | None = await self.get_game_by_vk_id(vk_chat_id, is_started=False, is_finished=False)
         user: User = (await self.get_users_list(vk_user_id=vk_user_id))[0]
         if user.id not in [player.id for player in game.players]:
-            async with self.app.database.session.begin() as session:
-                await session.execute(
-                    insert(games_users).values(game_id=game.id, user_id=user.id)
-                )
+            game.players.append(user)
+            self.state.insert(games_users, game_id=game.id, user_id=user.id)
             return user
 
     async def choose_capitan(self, vk_chat_id: int) -> User:
@@ -206,15 +374,8 @@ class GameAccessor(BaseAccessor):
             is_started=True,
             is_finished=False
         )
-        players = game.players[:]
-        shuffle(players)
-        user: User = (await self.get_users_list(vk_user_id=players[0].vk_id))[0]
-        async with self.app.database.session.begin() as session:
-            await session.execute(
-                update(GameModel)
-                .where(GameModel.chat_id == game.chat_id)
-                .values(capitan_id=user.id)
-            )
+        user: User = choice(game.players)
+        self.state.update(game, capitan_id=user.id)
         return user
 
     async def get_capitan(self, vk_chat_id: int) -> User | None:
@@ -225,115 +386,105 @@ class GameAccessor(BaseAccessor):
         )
         if not game:
             return
-        user: User = (await self.get_users_list(user_id=game.capitan_id))[0]
-        return user
+        return self._get_player(game, user_id=game.capitan_id)
+
+    @staticmethod
+    def _get_player(game: Game, user_id: int = None, vk_user_id: int = None) -> User | None:
+        for player in game.players:
+            if player.id == user_id or player.vk_id == vk_user_id:
+                return player
 
     async def start_game(self, vk_chat_id: int) -> None:
         game: Game = await self.get_game_by_vk_id(vk_chat_id, is_started=False, is_finished=False)
-        async with self.app.database.session.begin() as session:
-            await session.execute(
-                update(GameModel)
-                .where(and_(GameModel.id == game.id, GameModel.is_finished == False))
-                .values(is_started=True)
-            )
+        self.state.update(game, is_started=True, question_deck=await self._deal_question_deck(game))
+
+    async def _deal_question_deck(self, game: Game) -> list[int]:
+        """Случайная колода из еще не заданных в игре одобренных вопросов"""
+        used_ids = {question.id for question in game.questions}
+        question_ids = (await self.get_question_bank()).ids()
+        unused_ids = [question_id for question_id in question_ids if question_id not in used_ids]
+        # Если все вопросы уже были заданы - допускаем повторы
+        question_ids = unused_ids or question_ids
+        return sample(question_ids, min(DECK_SIZE, len(question_ids)))
 
     async def get_question_for_game(self, vk_chat_id: int) -> Question:
         game: Game = await self.get_game_by_vk_id(vk_chat_id, is_started=True, is_finished=False)
-        while True:
-            async with self.app.database.session() as session:
-                new_question: QuestionModel = await session.execute(
-                    select(QuestionModel)
-                    .where(QuestionModel.is_approved == True)
-                    .options(joinedload(QuestionModel.answers))
-                    .order_by(func.random()).limit(1)
-                )
-            new_question: Question = new_question.scalar().to_dc()
-            if new_question.title not in [question.to_dc().title for question in game.questions]:
-                break
-
-        async with self.app.database.session.begin() as session:
-            await session.execute(
-                insert(games_questions)
-                .values(game_id=game.id, question_id=new_question.id)
-            )
-            await session.execute(
-                update(GameModel)
-                .where(GameModel.id == game.id)
-                .values(question_time=datetime.now(), current_question=new_question.id)
-            )
+        question_bank = await self.get_question_bank()
+        deck = game.question_deck
+        new_question: Question | None = None
+        while new_question is None:
+            if not deck:
+                deck = await self._deal_question_deck(game)
+                if not deck:
+                    raise LookupError("There are no approved questions")
+            # Вопрос мог быть удален после раздачи колоды
+            new_question = question_bank.get(deck.pop())
+
+        game.questions.append(new_question)
+        self.state.insert(games_questions, game_id=game.id, question_id=new_question.id)
+        self.state.update(
+            game,
+            question_time=datetime.now(),
+            current_question=new_question.id,
+            question_deck=deck
+        )
         return new_question
 
     async def choose_respondent(self, vk_chat_id: int, vk_user_id: int) -> User | None:
         game: Game = await self.get_game_by_vk_id(vk_chat_id, is_started=True, is_finished=False)
-        user: list[User] | None = await self.get_users_list(vk_user_id=vk_user_id)
-        if not user or user[0].vk_id not in [player.vk_id for player in game.players]:
+        user: User | None = self._get_player(game, vk_user_id=vk_user_id)
+        if user is None:
             return
-        async with self.app.database.session.begin() as session:
-            await session.execute(
-                update(GameModel)
-                .where(
-                    and_(
-                        GameModel.id == game.id,
-                        GameModel.is_started == True,
-                        GameModel.is_finished == False
-                    )
-                )
-                .values(respondent_id=user[0].id)
-            )
-        return user[0]
+        self.state.update(game, respondent_id=user.id)
+        return user
 
     async def get_respondent(self, vk_chat_id: int) -> User | None:
         game: Game = await self.get_game_by_vk_id(vk_chat_id, is_started=True, is_finished=False)
         if not game.respondent_id:
             return
-        user: User = (await self.get_users_list(user_id=game.respondent_id))[0]
-        return user
+        return self._get_player(game, user_id=game.respondent_id)
 
     async def get_current_question(self, vk_chat_id: int) -> Question:
         game: Game = await self.get_game_by_vk_id(vk_chat_id, is_started=True, is_finished=False)
-        question: Question = await self.get_question_by_id(game.current_question)
+        question: Question | None = (await self.get_question_bank()).get(game.current_question)
+        if question is None:
+            # Вопрос сняли с публикации во время игры
+            question = await self.get_question_by_id(game.current_question)
         return question
 
-    async def check_answer(self, question_id: int) -> list[str]:
-        question: Question = await self.get_question_by_id(question_id)
-        answers = [answer.to_dc().title.lower() for answer in question.answers]
-        return answers
+    async def check_answer(self, question_id: int, answer: str) -> bool:
+        return (await self.get_question_bank()).check_answer(question_id, answer)
 
     async def add_score(self, vk_chat_id: int, players_side: bool = False) -> Game:
+        """Начисление очка одной из сторон; игра завершается тем же запросом при достижении WINNING_SCORE"""
         game: Game = await self.get_game_by_vk_id(vk_chat_id, is_started=True, is_finished=False)
-        game.players_score += players_side
-        game.bot_score += (not players_side)
-        async with self.app.database.session.begin() as session:
-            await session.execute(
+        players_delta, bot_delta = int(players_side), int(not players_side)
+        async with self.app.database.transaction() as session:
+            result = await session.execute(
                 update(GameModel)
-                .where(
-                    and_(
-                        GameModel.id == game.id,
-                        GameModel.is_started == True,
-                        GameModel.is_finished == False
-                    )
-                )
+                .where(and_(GameModel.id == game.id, GameModel.is_finished == False))
                 .values(
-                    players_score=game.players_score,
-                    bot_score=game.bot_score
-                )
-            )
-        return game
-
-    async def finish_game(self, vk_chat_id: int):
-        game: Game = await self.get_game_by_vk_id(vk_chat_id, is_started=True, is_finished=False)
-        async with self.app.database.session.begin() as session:
-            await session.execute(
-                update(GameModel)
-                .where(
-                    and_(
-                        GameModel.id == game.id,
-                        GameModel.is_started == True,
-                        GameModel.is_finished == False
+                    players_score=GameModel.players_score + players_delta,
+                    bot_score=GameModel.bot_score + bot_delta,
+                    # В SET используются значения строки до обновления
+                    is_finished=or_(
+                        GameModel.players_score + players_delta >= WINNING_SCORE,
+                        GameModel.bot_score + bot_delta >= WINNING_SCORE
                     )
                 )
-                .values(is_finished=True)
+                .returning(GameModel.players_score, GameModel.bot_score, GameModel.is_finished)
             )
+            row = result.one_or_none()
+        if row is None:
+            # Игра уже завершена параллельным обновлением
+            self.state.refresh(game, is_finished=True)
+        else:
+            self.state.refresh(
+                game, players_score=row.players_score, bot_score=row.bot_score, is_finished=row.is_finished
+            )
+        if game.is_finished:
+            self.state.set(vk_chat_id, None)
+        return game
 
     async def get_author(self, question: Question) -> User | None:
         if question.author_id:
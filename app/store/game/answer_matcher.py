@@ -0,0 +1,110 @@
+import re
+from typing import Iterable
+
+_NON_WORD_RE = re.compile(r"[\W_]+")
+# Окончания, отбрасываемые при упрощенном стемминге, по длине (от длинных к коротким)
+_ENDINGS = (
+    (3, frozenset(("ами", "ями", "ого", "его", "ому", "ему", "ыми", "ими"))),
+    (2, frozenset((
+        "ой", "ей", "ий", "ый", "ая", "яя", "ое", "ее", "ов", "ев", "ах", "ях", "ам", "ям", "ом", "ем", "ую", "юю"
+    ))),
+    (1, frozenset("аяоеыиуюь")),
+)
+MIN_STEM_LENGTH = 3
+
+
+def normalize(text: str, stemming: bool = False) -> str:
+    """Приведение ответа к каноническому виду: регистр, ё/е, пунктуация и лишние пробелы"""
+    words = _NON_WORD_RE.sub(" ", text.casefold().replace("ё", "е")).split()
+    if stemming:
+        words = [stem(word) for word in words]
+    return " ".join(words)
+
+
+def stem(word: str) -> str:
+    for length, endings in _ENDINGS:
+        if len(word) - length >= MIN_STEM_LENGTH and word[-length:] in endings:
+            return word[:-length]
+    return word
+
+
+def digit_tokens(text: str) -> tuple[str, ...]:
+    """Слова с цифрами: годы, числа, номера - в них опечатка меняет смысл ответа"""
+    return tuple(word for word in text.split() if any(char.isdigit() for char in word))
+
+
+def allowed_distance(length: int, max_distance: int) -> int:
+    """Допустимое число опечаток: в коротких ответах опечатки не прощаются"""
+    if length <= 3:
+        return 0
+    if length <= 7:
+        return min(1, max_distance)
+    return max_distance
+
+
+def bounded_distance(a: str, b: str, limit: int) -> int:
+    """Расстояние Дамерау-Левенштейна (с транспозициями соседних символов) или limit + 1, если оно больше limit"""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    if a == b:
+        return 0
+
+    # Общие начало и конец не влияют на расстояние
+    start = 0
+    while start < len(a) and start < len(b) and a[start] == b[start]:
+        start += 1
+    end = 0
+    while end < len(a) - start and end < len(b) - start and a[-1 - end] == b[-1 - end]:
+        end += 1
+    a, b = a[start:len(a) - end], b[start:len(b) - end]
+    if not a or not b:
+        return len(a) + len(b)
+
+    # Считаем только полосу шириной limit вокруг диагонали, остальные клетки заведомо больше limit
+    over = limit + 1
+    prev_prev: list[int] = []
+    prev = [j if j <= limit else over for j in range(len(b) + 1)]
+    for i in range(1, len(a) + 1):
+        current = [over] * (len(b) + 1)
+        current[0] = i if i <= limit else over
+        row_min = current[0]
+        for j in range(max(1, i - limit), min(len(b), i + limit) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            value = min(prev[j] + 1, current[j - 1] + 1, prev[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                value = min(value, prev_prev[j - 2] + 1)
+            current[j] = value if value <= limit else over
+            row_min = min(row_min, value)
+        # Дальше расстояние может только расти
+        if row_min > limit:
+            return over
+        prev_prev, prev = prev, current
+    return prev[-1]
+
+
+class AnswerMatcher:
+    """Проверка ответа на вопрос по заранее нормализованным правильным ответам"""
+
+    __slots__ = ("stemming", "max_distance", "exact", "fuzzy")
+
+    def __init__(self, answers: Iterable[str], stemming: bool = False, max_distance: int = 2):
+        self.stemming = stemming
+        self.max_distance = max_distance
+        self.exact: frozenset[str] = frozenset(filter(None, (normalize(answer, stemming) for answer in answers)))
+        # Для нечеткого сравнения: ответ, допустимое для него число опечаток и слова с цифрами,
+        # которые должны совпасть точно
+        self.fuzzy: tuple[tuple[str, int, tuple[str, ...]], ...] = tuple(
+            (answer, allowed_distance(len(answer), max_distance), digit_tokens(answer))
+            for answer in self.exact
+            if allowed_distance(len(answer), max_distance) > 0
+        )
+
+    def match(self, answer: str) -> bool:
+        answer = normalize(answer, self.stemming)
+        if answer in self.exact:
+            return True
+        digits = digit_tokens(answer)
+        for expected, limit, expected_digits in self.fuzzy:
+            if digits == expected_digits and bounded_distance(answer, expected, limit) <= limit:
+                return True
+        return False
@@ -0,0 +1,50 @@
+from typing import Optional
+
+from app.game.dataclasses import Question
+from app.store.game.answer_matcher import AnswerMatcher
+
+
+class QuestionBank:
+    """Одобренные вопросы в памяти процесса с заранее нормализованными ответами"""
+
+    def __init__(self, stemming: bool = False, max_distance: int = 2):
+        self.stemming = stemming
+        self.max_distance = max_distance
+        self.is_loaded = False
+        self.questions: dict[int, Question] = {}
+        self.answers: dict[int, AnswerMatcher] = {}
+
+    def __contains__(self, question_id: int) -> bool:
+        return question_id in self.questions
+
+    def __len__(self) -> int:
+        return len(self.questions)
+
+    def load(self, questions: list[Question]) -> None:
+        self.questions.clear()
+        self.answers.clear()
+        for question in questions:
+            self.add(question)
+        self.is_loaded = True
+
+    def add(self, question: Question) -> None:
+        self.questions[question.id] = question
+        self.answers[question.id] = AnswerMatcher(
+            (answer.title for answer in question.answers),
+            stemming=self.stemming,
+            max_distance=self.max_distance
+        )
+
+    def remove(self, question_id: int) -> None:
+        self.questions.pop(question_id, None)
+        self.answers.pop(question_id, None)
+
+    def get(self, question_id: int) -> Optional[Question]:
+        return self.questions.get(question_id)
+
+    def ids(self) -> list[int]:
+        return list(self.questions)
+
+    def check_answer(self, question_id: int, answer: str) -> bool:
+        matcher = self.answers.get(question_id)
+        return matcher is not None and matcher.match(answer)
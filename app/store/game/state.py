@@ -0,0 +1,306 @@
+import asyncio
+import typing
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from logging import getLogger
+from typing import Iterator, Optional
+
+from sqlalchemy import JSON, Table, func, select, type_coerce, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.engine import Row
+from sqlalchemy.exc import InterfaceError, OperationalError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.sql import Select
+
+from app.game.dataclasses import Game, Question, User
+from app.game.models import ChatModel, GameModel, QuestionModel, UserModel, games_questions, games_users
+
+if typing.TYPE_CHECKING:
+    from app.web.app import Application
+
+
+def game_from_model(model: GameModel) -> Game:
+    game = model.to_dc()
+    game.players = [player.to_dc() for player in model.players]
+    game.questions = [question.to_dc() for question in model.questions]
+    return game
+
+
+def active_games_query() -> Select:
+    """Активные игры вместе с vk_id чата, игроками и заданными вопросами за один запрос"""
+    players = (
+        select(func.json_agg(func.json_build_object("id", UserModel.id, "vk_id", UserModel.vk_id)))
+        .select_from(games_users.join(UserModel, UserModel.id == games_users.c.user_id))
+        .where(games_users.c.game_id == GameModel.id)
+        .scalar_subquery()
+    )
+    questions = (
+        select(
+            func.json_agg(
+                func.json_build_object(
+                    "id", QuestionModel.id,
+                    "title", QuestionModel.title,
+                    "answer_desc", QuestionModel.answer_desc,
+                    "author_id", QuestionModel.author_id,
+                    "is_approved", QuestionModel.is_approved
+                )
+            )
+        )
+        .select_from(games_questions.join(QuestionModel, QuestionModel.id == games_questions.c.question_id))
+        .where(games_questions.c.game_id == GameModel.id)
+        .scalar_subquery()
+    )
+    return (
+        select(
+            ChatModel.vk_id.label("vk_chat_id"),
+            GameModel.id,
+            GameModel.chat_id,
+            GameModel.capitan_id,
+            GameModel.respondent_id,
+            GameModel.current_question,
+            GameModel.question_time,
+            GameModel.bot_score,
+            GameModel.players_score,
+            GameModel.is_started,
+            GameModel.is_finished,
+            GameModel.question_deck,
+            type_coerce(players, JSON).label("players"),
+            type_coerce(questions, JSON).label("questions"),
+        )
+        .join(GameModel, GameModel.chat_id == ChatModel.id)
+        .where(GameModel.is_finished == False)
+    )
+
+
+def game_from_row(row: Row) -> Game:
+    return Game(
+        id=row.id,
+        chat_id=row.chat_id,
+        capitan_id=row.capitan_id,
+        respondent_id=row.respondent_id,
+        current_question=row.current_question,
+        question_time=row.question_time,
+        bot_score=row.bot_score,
+        players_score=row.players_score,
+        is_started=row.is_started,
+        is_finished=row.is_finished,
+        questions=[Question(answers=[], **question) for question in row.questions or []],
+        players=[User(**player) for player in row.players or []],
+        question_deck=list(row.question_deck or [])
+    )
+
+
+def is_transient(error: Exception) -> bool:
+    """Сбой соединения с БД: запись стоит повторить позже целиком, а не отбрасывать"""
+    return (
+        isinstance(error, (OperationalError, InterfaceError, OSError))
+        or getattr(error, "connection_invalidated", False)
+    )
+
+
+@dataclass
+class StateJournal:
+    """Изменения состояния игр в рамках одной единицы работы"""
+    updates: list[tuple[int, dict]] = field(default_factory=list)
+    inserts: list[tuple[Table, dict]] = field(default_factory=list)
+    game_ids: set[int] = field(default_factory=set)
+    vk_chat_ids: set[int] = field(default_factory=set)
+
+
+# Журнал открытой в текущей задаче единицы работы
+current_journal: ContextVar[Optional[StateJournal]] = ContextVar("current_journal", default=None)
+
+
+class GameStateStore:
+    """Состояние активных игр в памяти процесса с отложенной пакетной записью изменений в БД.
+
+    Источник истины для активных игр - память этого процесса, поэтому обслуживать бота должен ровно один
+    процесс (как и очереди чатов UpdateDispatcher). Несколько реплик, в том числе в режиме callback,
+    не поддерживаются: каждая держала бы свою копию игры и затирала бы записи других"""
+
+    def __init__(self, app: "Application", flush_interval: float = 1):
+        self.app = app
+        self.logger = getLogger("game_state")
+        self.flush_interval = flush_interval
+        # vk_id чата -> активная игра; None - в чате точно нет активной игры
+        self.games: dict[int, Optional[Game]] = {}
+        self._updates: dict[int, dict] = {}
+        self._inserts: list[tuple[Table, dict]] = []
+        # Изменения, которые записываются в БД прямо сейчас
+        self._flushing: tuple[list[tuple[Table, dict]], dict[int, dict]] = ([], {})
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self._flush_task: Optional[asyncio.Task] = None
+        self._flush_lock = asyncio.Lock()
+        # Изменения, которые не удалось записать из-за нарушения ограничений БД
+        self.dead_letters: deque[tuple[int, list[tuple[Table, dict]], dict]] = deque(maxlen=1000)
+        self.dead_letters_total = 0
+        self.failed_flushes = 0
+
+    def __contains__(self, vk_chat_id: int) -> bool:
+        return vk_chat_id in self.games
+
+    def get(self, vk_chat_id: int) -> Optional[Game]:
+        return self.games.get(vk_chat_id)
+
+    def set(self, vk_chat_id: int, game: Optional[Game]) -> None:
+        self.games[vk_chat_id] = game
+        if (journal := current_journal.get()) is not None:
+            journal.vk_chat_ids.add(vk_chat_id)
+
+    @contextmanager
+    def unit_of_work(self) -> Iterator[StateJournal]:
+        """Отложенная запись изменений только после успешного завершения блока.
+        При ошибке изменения отбрасываются, а затронутые игры вытесняются из памяти и перечитываются из БД"""
+        journal = StateJournal()
+        token = current_journal.set(journal)
+        try:
+            yield journal
+        except BaseException:
+            self._evict(journal)
+            raise
+        else:
+            for game_id, values in journal.updates:
+                self._updates.setdefault(game_id, {}).update(values)
+            self._inserts.extend(journal.inserts)
+            if journal.updates or journal.inserts:
+                self._schedule_flush()
+        finally:
+            current_journal.reset(token)
+
+    def _evict(self, journal: StateJournal) -> None:
+        for vk_chat_id, game in list(self.games.items()):
+            if vk_chat_id in journal.vk_chat_ids or (game is not None and game.id in journal.game_ids):
+                del self.games[vk_chat_id]
+
+    def pending(self, game_id: int) -> tuple[list[tuple[Table, dict]], dict]:
+        """Зафиксированные, но еще не записанные в БД изменения игры: их нужно наложить на прочитанную из БД игру"""
+        flushing_inserts, flushing_updates = self._flushing
+        rows = [(table, values) for table, values in flushing_inserts + self._inserts if values["game_id"] == game_id]
+        return rows, {**flushing_updates.get(game_id, {}), **self._updates.get(game_id, {})}
+
+    async def hydrate(self) -> None:
+        async with self.app.database.session() as session:
+            result = await session.execute(active_games_query())
+        for row in result:
+            self.games[row.vk_chat_id] = game_from_row(row)
+        self.logger.info(f"Загружено активных игр: {len(self.games)}")
+
+    def update(self, game: Game, **values) -> None:
+        """Изменение игры в памяти, запись в БД откладывается"""
+        for key, value in values.items():
+            setattr(game, key, value)
+        if (journal := current_journal.get()) is not None:
+            journal.game_ids.add(game.id)
+            journal.updates.append((game.id, values))
+            return
+        self._updates.setdefault(game.id, {}).update(values)
+        self._schedule_flush()
+
+    def refresh(self, game: Game, **values) -> None:
+        """Изменение игры в памяти значениями, уже записанными в БД"""
+        for key, value in values.items():
+            setattr(game, key, value)
+        if (journal := current_journal.get()) is not None:
+            journal.game_ids.add(game.id)
+
+    def insert(self, table: Table, **values) -> None:
+        if (journal := current_journal.get()) is not None:
+            journal.game_ids.add(values["game_id"])
+            journal.inserts.append((table, values))
+            return
+        self._inserts.append((table, values))
+        self._schedule_flush()
+
+    def _schedule_flush(self) -> None:
+        if self._flush_handle is None:
+            self._flush_handle = asyncio.get_running_loop().call_later(self.flush_interval, self._start_flush)
+
+    def _start_flush(self) -> None:
+        self._flush_handle = None
+        self._flush_task = asyncio.create_task(self.flush())
+
+    async def flush(self) -> None:
+        async with self._flush_lock:
+            if self._flush_handle is not None:
+                self._flush_handle.cancel()
+                self._flush_handle = None
+            inserts, self._inserts = self._inserts, []
+            updates, self._updates = self._updates, {}
+            if not inserts and not updates:
+                return
+
+            # Изменения каждой игры пишутся в своей точке сохранения: ошибка одной игры не мешает остальным
+            batches: dict[int, tuple[list[tuple[Table, dict]], dict]] = {
+                game_id: ([], values) for game_id, values in updates.items()
+            }
+            for table, values in inserts:
+                batches.setdefault(values["game_id"], ([], {}))[0].append((table, values))
+            self._flushing = (inserts, updates)
+            dead_letters_total = self.dead_letters_total
+            try:
+                async with self.app.database.session.begin() as session:
+                    for game_id, (rows, values) in batches.items():
+                        await self._write_game(session, game_id, rows, values)
+            except Exception as e:
+                # Сюда доходят только сбои соединения и ошибки фиксации всей транзакции
+                self.failed_flushes += 1
+                self.logger.error("Exception", exc_info=e)
+                # Возвращаем изменения в очередь, не затирая более свежие
+                self._inserts = inserts + self._inserts
+                for game_id, values in updates.items():
+                    self._updates[game_id] = {**values, **self._updates.get(game_id, {})}
+                self._schedule_flush()
+            finally:
+                self._flushing = ([], {})
+            if self.dead_letters_total > dead_letters_total:
+                self.logger.warning(
+                    f"Отброшено изменений игр: {self.dead_letters_total - dead_letters_total}, "
+                    f"всего с запуска: {self.dead_letters_total}"
+                )
+
+    @staticmethod
+    def _statements(game_id: int, rows: list[tuple[Table, dict]], values: dict) -> list:
+        statements = [insert(table).values(row).on_conflict_do_nothing() for table, row in rows]
+        if values:
+            statements.append(update(GameModel).where(GameModel.id == game_id).values(**values))
+        return statements
+
+    async def _write_game(
+            self, session: AsyncSession, game_id: int, rows: list[tuple[Table, dict]], values: dict
+    ) -> None:
+        try:
+            async with session.begin_nested():
+                for statement in self._statements(game_id, rows, values):
+                    await session.execute(statement)
+            return
+        except Exception as e:
+            if is_transient(e):
+                raise
+        # Нарушение ограничения (например, вопрос уже удален) и другие ошибки данных не исправятся повтором:
+        # пишем строки и поля по одной и откладываем в dead_letters только то, что не проходит
+        pieces = [([row], {}) for row in rows] + [([], {key: value}) for key, value in values.items()]
+        for piece_rows, piece_values in pieces:
+            try:
+                async with session.begin_nested():
+                    for statement in self._statements(game_id, piece_rows, piece_values):
+                        await session.execute(statement)
+            except Exception as e:
+                if is_transient(e):
+                    raise
+                self.logger.error(
+                    f"Изменение игры {game_id} отброшено: {piece_rows or piece_values}: {getattr(e, 'orig', e)}"
+                )
+                self.dead_letters.append((game_id, piece_rows, piece_values))
+                self.dead_letters_total += 1
+
+    def stats(self) -> dict:
+        return {
+            "games": len(self.games),
+            "queued_updates": len(self._updates),
+            "queued_inserts": len(self._inserts),
+            "failed_flushes": self.failed_flushes,
+            "dead_letters": len(self.dead_letters),
+            "dead_letters_total": self.dead_letters_total,
+        }
@@ -1,20 +1,28 @@
 import json
+import os
 import random
 import typing
-from datetime import datetime
-from io import BytesIO
-from re import fullmatch
+from hashlib import sha256
+from time import monotonic
 from typing import Optional
 
-import requests
-from aiohttp import TCPConnector
+from aiohttp import FormData, TCPConnector
 from aiohttp.client import ClientSession
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert
 
 from app.base.base_accessor import BaseAccessor
-from app.store.bot.image_app import create_image
-from app.store.vk_api.dataclasses import Message, Update, UpdateObject
+from app.base.lru_cache import LRUCache
+from app.bot.models import PhotoAttachmentModel
+from app.store.bot.image_app import CONTENT_TYPES, ImageRenderer, create_render_executor
+from app.store.bot.image_cache import ImageCache
+from app.store.vk_api.dataclasses import Message, Priority, Update
+from app.store.vk_api.exceptions import VkApiError
+from app.store.vk_api.execute_batcher import ExecuteBatcher
 from app.store.vk_api.poller import Poller
+from app.store.vk_api.scheduler import RequestScheduler
 from app.store.vk_api.schemes import KeyboardSchema
+from app.store.vk_api.users_loader import UsersLoader
 
 if typing.TYPE_CHECKING:
     from app.web.app import Application
@@ -30,9 +38,35 @@ class VkApiAccessor(BaseAccessor):
         self.server: Optional[str] = None
         self.poller: Optional[Poller] = None
         self.ts: Optional[int] = None
+        self.upload_urls: dict[int, tuple[str, float]] = {}
+        self.scheduler = RequestScheduler(rate=app.config.bot.rate_limit, burst=app.config.bot.rate_burst)
+        self.execute_batcher = ExecuteBatcher(self, window=app.config.bot.execute_window)
+        self.users_loader = UsersLoader(
+            self,
+            batch_delay=app.config.bot.users_batch_delay,
+            cache_size=app.config.bot.users_cache_size,
+            cache_ttl=app.config.bot.users_cache_ttl
+        )
+        self.image_cache = ImageCache(
+            app.config.bot.image_cache_size,
+            directory=app.config.bot.image_cache_dir,
+            renderer=ImageRenderer(profile=app.config.image)
+        )
+        # sha256 картинки -> вложение уже загруженного фото
+        self.photo_attachments = LRUCache(app.config.bot.photo_attachments_cache_size)
 
     async def connect(self, app: "Application"):
         self.session = ClientSession(connector=TCPConnector(verify_ssl=False))
+        self.image_cache.executor = create_render_executor(
+            app.config.bot.render_executor, app.config.bot.render_workers, profile=app.config.image
+        )
+        if self.image_cache.executor is None:
+            self.image_cache.renderer.preload()
+        else:
+            await self.image_cache.warm_up(app.config.bot.render_workers or os.cpu_count())
+        # В режиме callback события приходят на /vk.callback, long poll не нужен
+        if app.config.bot.mode != "longpoll":
+            return
         try:
             await self._get_long_poll_service()
         except Exception as e:
@@ -42,10 +76,14 @@ class VkApiAccessor(BaseAccessor):
         await self.poller.start()
 
     async def disconnect(self, app: "Application"):
-        if self.session:
-            await self.session.close()
         if self.poller:
             await self.poller.stop()
+        await self.app.store.bots_manager.dispatcher.stop()
+        await self.app.store.bots_manager.outbox.close()
+        await self.scheduler.stop()
+        self.image_cache.close()
+        if self.session:
+            await self.session.close()
 
     @staticmethod
     def _build_query(host: str, method: str, params: dict) -> str:
@@ -73,7 +111,7 @@ class VkApiAccessor(BaseAccessor):
             self.ts = data["ts"]
             self.logger.info(self.server)
 
-    async def poll(self):
+    async def poll(self) -> list[dict]:
         async with self.session.get(
                 self._build_query(
                     host=self.server,
@@ -87,344 +125,177 @@ class VkApiAccessor(BaseAccessor):
                 )
         ) as resp:
             data = await resp.json()
-            self.ts = data["ts"]
-            raw_updates = data.get("updates", [])
-            updates = []
-            for update in raw_updates:
-                if update['type'] == 'message_new':
-                    self.logger.info(data)
-                    message_text = update["object"]["message"]["text"]
-                    body = message_text
-                    peer_id = update["object"]["message"]["peer_id"]
-                    from_id = update["object"]["message"]["from_id"]
-                    # Если пришло сообщение из чата
-                    if peer_id != from_id:
-                        self.logger.info("Пришло сообщение из чата")
-
-                        # Если пригласили в беседу
-                        if (update_action := update["object"]["message"].get("action")) is not None and \
-                                update_action["type"] == "chat_invite_user" \
-                                and update_action["member_id"] == -self.app.config.bot.group_id:
-                            self.logger.info("Пригласили в беседу")
-                            event_type = "invite_bot"
-                            await self.app.store.game.add_new_chat(vk_chat_id=peer_id)
-                            body = "🎈 Приветствую! Я бот для игры «Что? Где? Когда?» Чтобы начать игру выдайте мне " \
-                                   "права администратора и напишите /start"
-
-                        # Если создали игру
-                        elif message_text == "/start":
-                            if not await self.app.store.game.get_game_by_vk_id(
-                                    vk_chat_id=peer_id,
-                                    is_finished=False
-                            ):
-                                event_type = "start_game"
-
-                                await self.app.store.game.create_new_game(
-                                    chat_id=peer_id
-                                )
-                                body = "✔ Игра начнется как только будет написано /ready!%0A" \
-                                       "Чтобы присоединиться к игре нажмите на кнопку или напишите /join"
-
-                            else:
-                                event_type = "try_start_game"
-
-                                body = "❗ Вы не можете начать новую игру, пока не завершилась предыдущая!"
-
-                        # Запуск игры после набора участников
-                        elif message_text == "/ready":
-                            if await self.app.store.game.get_game_by_vk_id(
-                                vk_chat_id=peer_id,
-                                is_started=False,
-                                is_finished=False
-                            ):
-                                event_type = "players_ready"
-
-                                await self.app.store.game.start_game(
-                                    vk_chat_id=peer_id
-                                )
-
-                                capitan_id = await self.app.store.game.choose_capitan(
-                                    vk_chat_id=peer_id
-                                )
-                                info = (await self.app.store.vk_api.get_users_info(capitan_id.vk_id))[0]
-                                await self.app.store.vk_api.send_message(
-                                    Message(
-                                        peer_id=peer_id,
-                                        text=f"✔ Игроки готовы, а значит можно начинать!%0A%0A"
-                                             f"🧢 Капитан команды - [id{info['id']}|{info['first_name']} "
-                                             f"{info['last_name']}]%0A%0A"
-                                             f"⏱ В течение 1.5 минуты после каждого вопроса, он должен выбрать "
-                                             f"(через обращение @) того, кто отвечает",
-                                        keyboard=None,
-                                        attachment=None
-                                    )
-                                )
-
-                                question = await self.app.store.game.get_question_for_game(
-                                    vk_chat_id=peer_id
-                                )
-                                body = f"{question.title}"
-                                author = await self.app.store.game.get_author(question)
-                                if author:
-                                    info = (await self.app.store.vk_api.get_users_info(author.vk_id))[0]
-                                    body += f"|{info['first_name']} {info['last_name']}"
-                            else:
-                                event_type = "try_players_ready"
-
-                                body = "❗ Сейчас вы не можете запустить игру!"
-
-                        # Выбор отвечающего
-                        elif fullmatch(r"\[id\d+\|.+]", message_text):
-                            event_type = "tag_user"
-                            capitan = await self.app.store.game.get_capitan(peer_id)
-                            if not capitan:
-                                event_type = None
-                            elif capitan.vk_id != from_id:
-                                body = "❗ Вы не можете выбрать отвечающего, т.к. не являетесь капитаном команды!"
-                            elif not await self.app.store.game.choose_respondent(
-                                vk_chat_id=peer_id,
-                                vk_user_id=int(message_text.split("|")[0][3:])
-                            ):
-                                body = "❗ Этот игрок не участвует в игре!"
-                            else:
-                                body = f"На вопрос отвечает {message_text}"
 
-                        # Ответ на вопрос
-                        elif fullmatch(r"/answer .+", message_text):
-                            event_type = "players_answer"
-                            respondent = await self.app.store.game.get_respondent(
-                                vk_chat_id=peer_id
-                            )
-                            if respondent is None or from_id != respondent.vk_id:
-                                info = (
-                                    await self.app.store.vk_api.get_users_info(from_id)
-                                )[0]
-                                body = f"❗ [id{info['id']}|{info['first_name']} {info['last_name']}], " \
-                                       "Вы не были выбраны в качестве игрока, который должен отвечать!"
-                            else:
-                                question = await self.app.store.game.get_current_question(vk_chat_id=peer_id)
-                                answers = await self.app.store.game.check_answer(question_id=question.id)
-
-                                game = await self.app.store.game.get_game_by_vk_id(
-                                    vk_chat_id=peer_id,
-                                    is_started=True,
-                                    is_finished=False
-                                )
-                                if (datetime.now() - game.question_time).seconds > 90:
-                                    body = f"❌ Прошло более 1.5 минуты. Ответ не засчитан%0A%0A"
-                                    game = await self.app.store.game.add_score(
-                                        vk_chat_id=peer_id,
-                                        players_side=False
-                                    )
-                                elif message_text[8:].lower() in answers:
-                                    game = await self.app.store.game.add_score(
-                                        vk_chat_id=peer_id,
-                                        players_side=True
-                                    )
-
-                                    body = "✔ Это правильный ответ!%0A%0A"
-
-                                else:
-                                    game = await self.app.store.game.add_score(
-                                        vk_chat_id=peer_id,
-                                        players_side=False
-                                    )
-
-                                    body = "❌ Это неправильный ответ!%0A%0A"
-
-                                body += f"🙋‍♂️Ваша команда {game.players_score} : 🤖 Бот {game.bot_score}"
-
-                                updates.append(
-                                    Update(
-                                        type=update['type'],
-                                        object=UpdateObject(
-                                            id=update['object']['message']['id'],
-                                            user_id=from_id,
-                                            peer_id=peer_id,
-                                            body=body,
-                                            event_type=event_type
-                                        )
-                                    )
-                                )
-
-                                body = f"{question.answer_desc}"
-
-                                updates.append(
-                                    Update(
-                                        type=update['type'],
-                                        object=UpdateObject(
-                                            id=update['object']['message']['id'],
-                                            user_id=from_id,
-                                            peer_id=peer_id,
-                                            body=body,
-                                            event_type="get_answer"
-                                        )
-                                    )
-                                )
-
-                                if 6 in (game.players_score, game.bot_score):
-                                    event_type = "finished"
-                                    if game.players_score == 6:
-                                        body = "%0A%0A🥳 Поздравляю! Вы победили!"
-                                    elif game.bot_score == 6:
-                                        body = "%0A%0A😕 Увы, вы проиграли!"
-                                    await self.app.store.game.finish_game(peer_id)
-
-                                else:
-                                    event_type = "get_question"
-                                    question = await self.app.store.game.get_question_for_game(
-                                        vk_chat_id=peer_id
-                                    )
-                                    body = f"{question.title}"
-                                    author = await self.app.store.game.get_author(question)
-                                    if author:
-                                        info = (await self.app.store.vk_api.get_users_info(author.vk_id))[0]
-                                        body += f"|{info['first_name']} {info['last_name']}"
-
-                        # Если была нажата кнопка "Присоединится" или написали /join
-                        elif update["object"]["message"].get("payload") is not None and \
-                                update["object"]["message"]["payload"] == "{\"game\":\"ready\"}" or \
-                                message_text == "/join":
-                            event_type = "join_game"
-
-                            if not await self.app.store.game.get_game_by_vk_id(
-                                vk_chat_id=peer_id,
-                                is_started=False,
-                                is_finished=False
-                            ):
-                                event_type = "try_join_game"
-                                body = "❗ Нельзя присоединится к игре в данный момент"
-                            else:
-                                await self.app.store.game.add_new_user(
-                                    vk_id=from_id
-                                )
-                                if not await self.app.store.game.add_new_player(
-                                    vk_user_id=from_id,
-                                    vk_chat_id=peer_id
-                                ):
-                                    body = "❗ Вы уже присоединились к игре"
-                                else:
-                                    info = (await self.app.store.vk_api.get_users_info(from_id))[0]
-                                    body = f"➕ [id{info['id']}|{info['first_name']} {info['last_name']}] " \
-                                           f"присоединился к игре!"
-
-                        else:
-                            event_type = "other"
-
-                        updates.append(
-                            Update(
-                                type=update["type"],
-                                object=UpdateObject(
-                                    id=update["object"]["message"]["id"],
-                                    user_id=from_id,
-                                    peer_id=peer_id,
-                                    body=body,
-                                    event_type=event_type
-                                )
-                            )
-                        )
-
-                    else:
-                        # Личка
-                        updates.append(
-                            Update(
-                                type=update['type'],
-                                object=UpdateObject(
-                                    id=update['object']['message']['id'],
-                                    user_id=from_id,
-                                    peer_id=peer_id,
-                                    body=body,
-                                    event_type="personal_msg"
-                                )
-                            )
-                        )
-            return updates
-
-    async def send_message(self, message: Message) -> None:
-        async with self.session.get(
-                self._build_query(
-                    API_PATH,
-                    "messages.send",
-                    params={
-                        "peer_id": message.peer_id,
-                        "random_id": random.randint(1, 2 ** 32),
-                        "message": message.text,
+        if "failed" in data:
+            # История событий устарела или истек ключ - обновляем параметры long poll сервера
+            if data["failed"] == 1:
+                self.ts = data["ts"]
+            else:
+                await self._get_long_poll_service()
+            return []
+
+        self.ts = data["ts"]
+        return data.get("updates", [])
+
+    async def execute(self, code: str, priority: Priority = Priority.NORMAL) -> dict:
+        async def request() -> dict:
+            async with self.session.post(
+                    API_PATH + "execute",
+                    data={
+                        "code": code,
                         "access_token": self.app.config.bot.token,
-                        "keyboard": str(json.dumps(KeyboardSchema().dump(message.keyboard))),
-                        "attachment": message.attachment
-                    },
-                )
-        ) as resp:
-            data = await resp.json()
-            self.logger.info(data)
+                        "v": "5.131",
+                    }
+            ) as resp:
+                return await resp.json()
 
-    async def get_users_info(self, user_ids: list[int]):
-        async with self.session.get(
-            self._build_query(
-                API_PATH,
-                "users.get",
-                params={
-                    "access_token": self.app.config.bot.token,
-                    "user_ids": user_ids
-                }
-            )
-        ) as resp:
-            data = await resp.json()
-            return data["response"]
+        return await self.scheduler.submit(priority, request)
 
-    async def get_messages_upload_server(self, peer_id: int) -> str:
-        async with self.session.get(
-                self._build_query(
-                    API_PATH,
-                    "photos.getMessagesUploadServer",
-                    params={
-                        "access_token": self.app.config.bot.token,
-                        "peer_id": peer_id
-                    }
-                )
-        ) as resp:
-            data = await resp.json()
-            return data["response"]["upload_url"]
+    async def send_message(self, message: Message) -> None:
+        try:
+            await self._send_message(message)
+        except VkApiError as e:
+            # Сохраненное вложение могло устареть - загружаем фото заново и повторяем отправку.
+            # Другие ошибки (лимит запросов, сбой всего execute) к вложению отношения не имеют
+            if not message.photos or not e.is_invalid_attachment:
+                raise
+            self.logger.warning(f"VK отклонил сообщение с вложениями {message.attachment}, загружаем фото заново")
+            attachments = {}
+            for attachment, image in message.photos.items():
+                attachments[attachment] = await self.reupload_photo(message.peer_id, image, message.priority)
+            message.attachment = ",".join(attachments.get(a, a) for a in message.attachment.split(","))
+            message.photos = {}
+            await self._send_message(message)
+
+    async def _send_message(self, message: Message) -> None:
+        data = await self.execute_batcher.call(
+            "messages.send",
+            params={
+                "peer_id": message.peer_id,
+                "random_id": random.randint(1, 2 ** 31 - 1),
+                "message": message.text,
+                "keyboard": str(json.dumps(KeyboardSchema().dump(message.keyboard))),
+                "attachment": message.attachment
+            },
+            priority=message.priority
+        )
+        self.logger.info(data)
 
-    async def save_message_photo(self, photo: BytesIO, server: str, hash_: str) -> None:
-        async with self.session.get(
+    async def users_get(self, user_ids: list[int]) -> list[dict]:
+        async def request() -> dict:
+            async with self.session.get(
                 self._build_query(
                     API_PATH,
-                    "photos.saveMessagesPhoto",
+                    "users.get",
                     params={
                         "access_token": self.app.config.bot.token,
-                        "photo": photo,
-                        "server": server,
-                        "hash": hash_
+                        "user_ids": ",".join(map(str, user_ids))
                     }
                 )
-        ) as resp:
-            data = await resp.json()
-            return data["response"][0]
-
-    async def get_photo(self, update: Update, image_path: str) -> dict:
-        server = await self.app.store.vk_api.get_messages_upload_server(update.object.peer_id)
+            ) as resp:
+                return await resp.json()
+
+        data = await self.scheduler.submit(Priority.NORMAL, request)
+        return data["response"]
+
+    async def get_users_info(self, user_ids: int | list[int]) -> list[dict]:
+        if isinstance(user_ids, int):
+            user_ids = [user_ids]
+        return await self.users_loader.load_many(user_ids)
+
+    async def get_messages_upload_server(self, peer_id: int, priority: Priority = Priority.NORMAL) -> str:
+        data = await self.execute_batcher.call(
+            "photos.getMessagesUploadServer",
+            params={
+                "peer_id": peer_id
+            },
+            priority=priority
+        )
+        return data["upload_url"]
+
+    async def save_message_photo(self, photo: str, server: int, hash_: str,
+                                 priority: Priority = Priority.NORMAL) -> dict:
+        data = await self.execute_batcher.call(
+            "photos.saveMessagesPhoto",
+            params={
+                "photo": photo,
+                "server": server,
+                "hash": hash_
+            },
+            priority=priority
+        )
+        return data[0]
+
+    async def get_upload_url(self, peer_id: int, priority: Priority = Priority.NORMAL) -> str:
+        """Адрес загрузки фото для чата, переиспользуется до истечения upload_url_ttl"""
+        cached = self.upload_urls.get(peer_id)
+        if cached is not None and cached[1] > monotonic():
+            return cached[0]
+        upload_url = await self.get_messages_upload_server(peer_id, priority)
+        self.upload_urls[peer_id] = (upload_url, monotonic() + self.app.config.bot.upload_url_ttl)
+        return upload_url
+
+    async def upload_photo(self, peer_id: int, image: bytes, priority: Priority = Priority.NORMAL) -> dict:
+        for _ in range(2):
+            form = FormData()
+            image_format = self.app.config.image.format
+            form.add_field("file", image, filename=f"file.{image_format}", content_type=CONTENT_TYPES[image_format])
+            async with self.session.post(await self.get_upload_url(peer_id, priority), data=form) as resp:
+                data = await resp.json(content_type=None)
+            if data.get("photo") not in (None, "", "[]"):
+                return data
+            # Адрес загрузки устарел - запрашиваем новый и повторяем
+            self.logger.warning(f"Не удалось загрузить фото: {data}")
+            self.upload_urls.pop(peer_id, None)
+        raise RuntimeError(f"Photo upload failed for peer {peer_id}")
+
+    async def get_photo(
+            self, update: Update, image_path: str, priority: Priority = Priority.HIGH
+    ) -> tuple[str, bytes]:
+        """Вложение с картинкой по тексту обновления и сама картинка"""
         body = update.object.body.split("|")
         question = body[0]
         author_name = None
         if len(body) == 2:
             author_name = body[1]
-        print("AAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAA", body, question, author_name)
-        response = requests.post(
-            url=server,
-            files={"file": (
-                "file.png", create_image(
-                    image_path=image_path,
-                    text=question,
-                    author_name=author_name
-                )
-            )}
-        ).json()
-
-        photo = await self.app.store.vk_api.save_message_photo(
+        image = await self.image_cache.render(image_path, question, author_name)
+        return await self.get_photo_attachment(update.object.peer_id, image, priority), image
+
+    async def get_photo_attachment(self, peer_id: int, image: bytes, priority: Priority = Priority.NORMAL) -> str:
+        """Вложение для картинки: уже загруженное фото с тем же содержимым или новая загрузка"""
+        content_hash = sha256(image).hexdigest()
+        attachment = self.photo_attachments.get(content_hash)
+        if attachment is not None:
+            return attachment
+        async with self.app.database.transaction() as session:
+            attachment = (await session.execute(
+                select(PhotoAttachmentModel.attachment)
+                .where(PhotoAttachmentModel.content_hash == content_hash)
+            )).scalar()
+        if attachment is None:
+            return await self.reupload_photo(peer_id, image, priority)
+        self.photo_attachments.set(content_hash, attachment)
+        return attachment
+
+    async def reupload_photo(self, peer_id: int, image: bytes, priority: Priority = Priority.NORMAL) -> str:
+        """Загрузка фото и сохранение вложения для следующих отправок той же картинки"""
+        response = await self.upload_photo(peer_id, image, priority)
+        photo = await self.save_message_photo(
             server=response["server"],
             photo=response["photo"],
-            hash_=response["hash"]
+            hash_=response["hash"],
+            priority=priority
         )
-
-        return photo
+        attachment = f"photo{photo['owner_id']}_{photo['id']}"
+
+        content_hash = sha256(image).hexdigest()
+        insert_stmt = insert(PhotoAttachmentModel).values(content_hash=content_hash, attachment=attachment)
+        async with self.app.database.transaction() as session:
+            await session.execute(
+                insert_stmt.on_conflict_do_update(
+                    index_elements=["content_hash"],
+                    set_={"attachment": insert_stmt.excluded.attachment}
+                )
+            )
+        self.photo_attachments.set(content_hash, attachment)
+        return attachment
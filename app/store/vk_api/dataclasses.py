@@ -1,4 +1,13 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field
+from enum import IntEnum
+
+
+class Priority(IntEnum):
+    # Вопросы и вердикты по ответам
+    HIGH = 0
+    NORMAL = 1
+    # Приветствия и подтверждения присоединения к игре
+    LOW = 2
 
 
 @dataclass
@@ -25,6 +34,9 @@ class Message:
     text: str
     keyboard: Keyboard | None
     attachment: str | None
+    priority: Priority = Priority.NORMAL
+    # Содержимое вложенных фото по строке вложения - для повторной загрузки, если VK отклонит вложение
+    photos: dict[str, bytes] = field(default_factory=dict)
 
 
 @dataclass
@@ -0,0 +1,19 @@
+from typing import Optional
+
+# Ошибка VK "неверный параметр", которую messages.send возвращает для устаревшего или чужого вложения
+INVALID_PARAMETER = 100
+
+
+class VkApiError(Exception):
+    def __init__(self, method: str, error: dict | None = None):
+        self.method = method
+        self.error = error
+        super().__init__(f"{method}: {error}")
+
+    @property
+    def code(self) -> Optional[int]:
+        return self.error.get("error_code") if self.error else None
+
+    @property
+    def is_invalid_attachment(self) -> bool:
+        return self.code == INVALID_PARAMETER and "attachment" in self.error.get("error_msg", "").lower()
@@ -0,0 +1,76 @@
+import asyncio
+import json
+import typing
+from logging import getLogger
+from typing import Any, Optional
+
+from app.store.vk_api.dataclasses import Priority
+from app.store.vk_api.exceptions import VkApiError
+
+if typing.TYPE_CHECKING:
+    from app.store.vk_api.accessor import VkApiAccessor
+
+# Метод execute выполняет не более 25 обращений к API за один запрос
+MAX_EXECUTE_CALLS = 25
+
+
+class ExecuteBatcher:
+    """Объединение вызовов методов VK API из всех чатов в запросы execute"""
+
+    def __init__(self, vk_api: "VkApiAccessor", window: float = 0):
+        self.vk_api = vk_api
+        self.logger = getLogger("execute_batcher")
+        self.window = window
+        self._pending: list[tuple[str, dict, Priority, asyncio.Future]] = []
+        self._flush_handle: Optional[asyncio.Handle] = None
+
+    async def call(self, method: str, params: dict, priority: Priority = Priority.NORMAL) -> Any:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((method, params, priority, future))
+        if len(self._pending) >= MAX_EXECUTE_CALLS:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.window, self._flush)
+        return await asyncio.shield(future)
+
+    def _flush(self) -> None:
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        batch, self._pending = self._pending, []
+        if batch:
+            asyncio.create_task(self._execute(batch))
+
+    @staticmethod
+    def _build_code(batch: list[tuple[str, dict, Priority, asyncio.Future]]) -> str:
+        calls = []
+        for method, params, *_ in batch:
+            # Параметры передаются в теле запроса как JSON и не требуют экранирования для URL
+            args = {key: value for key, value in params.items() if value is not None}
+            calls.append(f"API.{method}({json.dumps(args, ensure_ascii=False)})")
+        return f"return [{','.join(calls)}];"
+
+    async def _execute(self, batch: list[tuple[str, dict, Priority, asyncio.Future]]) -> None:
+        try:
+            # Пакет отправляется с приоритетом самого срочного вызова в нем
+            priority = min(priority for _, _, priority, _ in batch)
+            data = await self.vk_api.execute(self._build_code(batch), priority=priority)
+            if "error" in data:
+                raise VkApiError("execute", data["error"])
+        except Exception as e:
+            self.logger.error("Exception", exc_info=e)
+            for *_, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        # execute_errors содержит по записи на каждый неудавшийся вызов в порядке их выполнения
+        errors = iter(data.get("execute_errors") or [])
+        for (method, _, _, future), result in zip(batch, data["response"]):
+            if result is False:
+                error = next(errors, None)
+                if not future.done():
+                    future.set_exception(VkApiError(method, error))
+            elif not future.done():
+                future.set_result(result)
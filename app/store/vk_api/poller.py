@@ -1,5 +1,6 @@
 import asyncio
 from asyncio import Task
+from logging import getLogger
 from typing import Optional
 
 from app.store import Store
@@ -8,6 +9,7 @@ from app.store import Store
 class Poller:
     def __init__(self, store: Store):
         self.store = store
+        self.logger = getLogger("poller")
         self.is_running = False
         self.poll_task: Optional[Task] = None
 
@@ -17,9 +19,20 @@ class Poller:
 
     async def stop(self):
         self.is_running = False
-        await self.poll_task
+        if self.poll_task:
+            self.poll_task.cancel()
+            await asyncio.gather(self.poll_task, return_exceptions=True)
 
     async def poll(self):
         while self.is_running:
-            updates = await self.store.vk_api.poll()
-            await self.store.bots_manager.handle_updates(updates)
+            try:
+                raw_updates = await self.store.vk_api.poll()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.logger.error("Exception", exc_info=e)
+                await asyncio.sleep(1)
+                continue
+
+            for raw_update in raw_updates:
+                await self.store.bots_manager.dispatcher.dispatch(raw_update)
@@ -0,0 +1,89 @@
+import asyncio
+from itertools import count
+from logging import getLogger
+from time import monotonic
+from typing import Any, Awaitable, Callable, Optional
+
+from app.store.vk_api.dataclasses import Priority
+
+
+class RequestScheduler:
+    """Очередь исходящих запросов к VK API с ограничением частоты (token bucket) и приоритетами"""
+
+    def __init__(self, rate: float, burst: int):
+        self.logger = getLogger("scheduler")
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated_at = monotonic()
+        self._queue: asyncio.PriorityQueue = asyncio.PriorityQueue()
+        self._seq = count()
+        self._task: Optional[asyncio.Task] = None
+        self.metrics: dict[Priority, dict] = {
+            priority: {"requests": 0, "total_wait": 0.0, "max_wait": 0.0} for priority in Priority
+        }
+
+    async def submit(self, priority: Priority, request: Callable[[], Awaitable[Any]]) -> Any:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+        future = asyncio.get_running_loop().create_future()
+        # Запросы не отбрасываются: при превышении лимита они ждут своей очереди
+        self._queue.put_nowait((priority, next(self._seq), monotonic(), request, future))
+        return await asyncio.shield(future)
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _acquire_token(self) -> None:
+        while True:
+            now = monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+            self.updated_at = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    async def _run(self) -> None:
+        while True:
+            # Запрос выбирается только после получения токена: более срочные запросы,
+            # пришедшие за время ожидания, обгоняют уже стоящие в очереди
+            self._queue.put_nowait(await self._queue.get())
+            await self._acquire_token()
+            priority, _, enqueued_at, request, future = self._queue.get_nowait()
+
+            wait = monotonic() - enqueued_at
+            metrics = self.metrics[priority]
+            metrics["requests"] += 1
+            metrics["total_wait"] += wait
+            metrics["max_wait"] = max(metrics["max_wait"], wait)
+
+            asyncio.create_task(self._send(request, future))
+
+    @staticmethod
+    async def _send(request: Callable[[], Awaitable[Any]], future: asyncio.Future) -> None:
+        try:
+            result = await request()
+        except Exception as e:
+            if not future.done():
+                future.set_exception(e)
+        else:
+            if not future.done():
+                future.set_result(result)
+
+    def stats(self) -> dict:
+        return {
+            "queue_size": self._queue.qsize(),
+            "tokens": self.tokens,
+            "priorities": {
+                priority.name.lower(): {
+                    "requests": metrics["requests"],
+                    "avg_wait": metrics["total_wait"] / metrics["requests"] if metrics["requests"] else 0.0,
+                    "max_wait": metrics["max_wait"],
+                }
+                for priority, metrics in self.metrics.items()
+            },
+        }
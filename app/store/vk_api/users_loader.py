@@ -0,0 +1,73 @@
+import asyncio
+import typing
+from logging import getLogger
+from typing import Optional
+
+from app.base.lru_cache import LRUCache
+
+if typing.TYPE_CHECKING:
+    from app.store.vk_api.accessor import VkApiAccessor
+
+# users.get принимает не более 1000 идентификаторов за вызов
+MAX_BATCH_SIZE = 1000
+
+
+class UsersLoader:
+    """Объединение запросов имен пользователей в один вызов users.get с кэшированием результата"""
+
+    def __init__(self, vk_api: "VkApiAccessor", batch_delay: float = 0, cache_size: int = 10000,
+                 cache_ttl: Optional[float] = 3600):
+        self.vk_api = vk_api
+        self.logger = getLogger("users_loader")
+        self.batch_delay = batch_delay
+        self.cache = LRUCache(maxsize=cache_size, ttl=cache_ttl)
+        self._pending: dict[int, asyncio.Future] = {}
+        self._flush_handle: Optional[asyncio.Handle] = None
+
+    async def load(self, vk_id: int) -> Optional[dict]:
+        info = self.cache.get(vk_id)
+        if info is not None:
+            return info
+
+        future = self._pending.get(vk_id)
+        if future is None:
+            loop = asyncio.get_running_loop()
+            future = self._pending[vk_id] = loop.create_future()
+            if len(self._pending) >= MAX_BATCH_SIZE:
+                self._flush()
+            elif self._flush_handle is None:
+                self._flush_handle = loop.call_later(self.batch_delay, self._flush)
+        return await asyncio.shield(future)
+
+    async def load_many(self, vk_ids: list[int]) -> list[dict]:
+        users = await asyncio.gather(*(self.load(vk_id) for vk_id in vk_ids))
+        return [info for info in users if info is not None]
+
+    def _flush(self) -> None:
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        batch, self._pending = self._pending, {}
+        if batch:
+            asyncio.create_task(self._fetch(batch))
+
+    async def _fetch(self, batch: dict[int, asyncio.Future]) -> None:
+        try:
+            users = await self.vk_api.users_get(list(batch))
+        except Exception as e:
+            self.logger.error("Exception", exc_info=e)
+            for future in batch.values():
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for user in users:
+            info = {"id": user["id"], "first_name": user["first_name"], "last_name": user["last_name"]}
+            self.cache.set(user["id"], info)
+            future = batch.pop(user["id"], None)
+            if future is not None and not future.done():
+                future.set_result(info)
+        # Пользователи, которых VK не вернул
+        for future in batch.values():
+            if not future.done():
+                future.set_result(None)
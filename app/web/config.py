@@ -1,6 +1,7 @@
 import os.path
 import typing
 from dataclasses import dataclass
+from typing import Optional
 
 import yaml
 
@@ -25,6 +26,64 @@ class AdminConfig:
 class BotConfig:
     token: str
     group_id: int
+    # longpoll или callback. В обоих режимах бот работает одним процессом: состояние активных игр
+    # и очереди чатов хранятся в его памяти, несколько реплик за балансировщиком не поддерживаются
+    mode: str = "longpoll"
+    secret: Optional[str] = None
+    confirmation: Optional[str] = None
+    workers: int = 4
+    queue_size: int = 1000
+    lane_idle_timeout: float = 60
+    upload_url_ttl: float = 600
+    outbox_window: float = 0.25
+    execute_window: float = 0.01
+    rate_limit: float = 20
+    rate_burst: int = 20
+    users_batch_delay: float = 0.005
+    users_cache_size: int = 10000
+    users_cache_ttl: float = 3600
+    # Кэш отрисованных картинок: число картинок в памяти и необязательный каталог на диске
+    image_cache_size: int = 64
+    image_cache_dir: Optional[str] = None
+    photo_attachments_cache_size: int = 10000
+    # Отрисовка картинок: process, thread или none; число исполнителей, по умолчанию по числу ядер
+    render_executor: str = "process"
+    render_workers: Optional[int] = None
+
+    def __post_init__(self):
+        # Без секрета любой, кто знает публичный group_id, может прислать поддельное событие
+        if self.mode == "callback" and not self.secret:
+            raise ValueError("bot.secret is required in callback mode")
+
+
+@dataclass
+class GameConfig:
+    # Период отложенной записи состояния игр в БД, сек
+    flush_interval: float = 1
+    chat_cache_size: int = 100000
+    # Проверка ответов: упрощенный стемминг и максимальное число прощаемых опечаток
+    answer_stemming: bool = False
+    answer_max_distance: int = 2
+
+
+@dataclass
+class ImageConfig:
+    # Формат загружаемых картинок: png или jpeg
+    format: str = "png"
+    # Качество JPEG, 1-95
+    quality: int = 85
+    # Дополнительный проход оптимизации: файл меньше, кодирование дольше
+    optimize: bool = False
+    # Число цветов палитры PNG; пусто - полноцветная картинка
+    colors: Optional[int] = None
+    # Наибольшие ширина и высота; картинка большего размера уменьшается с сохранением пропорций
+    max_width: Optional[int] = None
+    max_height: Optional[int] = None
+
+    def __post_init__(self):
+        # Другие форматы VK не принимает; без проверки ошибка всплыла бы только при первой отрисовке
+        if self.format not in ("png", "jpeg"):
+            raise ValueError(f"image.format must be png or jpeg, got {self.format!r}")
 
 
 @dataclass
@@ -34,6 +93,24 @@ class DatabaseConfig:
     user: str = "postgres"
     password: str = "postgres"
     database: str = "project"
+    # Пул соединений: постоянные и дополнительные соединения, проверка перед выдачей, пересоздание через N сек
+    pool_size: int = 5
+    max_overflow: int = 10
+    pool_timeout: float = 30
+    pool_pre_ping: bool = False
+    pool_recycle: int = -1
+    # Число подготовленных запросов, кэшируемых на соединение; 0 - без кэша
+    statement_cache_size: int = 100
+    # Таймаут выполнения запроса, сек
+    command_timeout: Optional[float] = None
+    echo: bool = False
+
+    @property
+    def url(self) -> str:
+        return (
+            f"postgresql+asyncpg://{self.user}:{self.password}"
+            f"@{self.host}:{self.port or 5432}/{self.database}"
+        )
 
 
 @dataclass
@@ -42,13 +119,15 @@ class Config:
     session: SessionConfig = None
     bot: BotConfig = None
     database: DatabaseConfig = None
+    game: GameConfig = None
+    image: ImageConfig = None
 
 
 def get_sqlalchemy_url(config_path: str = base_config_path):
     with open(config_path, "r") as f:
         cfg = (yaml.safe_load(f))["database"]
 
-    return f"postgresql+asyncpg://{cfg['user']}:{cfg['password']}@{cfg['host']}/{cfg['database']}"
+    return DatabaseConfig(**cfg).url
 
 
 def setup_config(app: "Application", config_path: str = base_config_path):
@@ -63,9 +142,8 @@ def setup_config(app: "Application", config_path: str = base_config_path):
             email=raw_config["admin"]["email"],
             password=raw_config["admin"]["password"],
         ),
-        bot=BotConfig(
-            token=raw_config["bot"]["token"],
-            group_id=raw_config["bot"]["group_id"],
-        ),
+        bot=BotConfig(**raw_config["bot"]),
         database=DatabaseConfig(**raw_config["database"]),
+        game=GameConfig(**raw_config.get("game", {})),
+        image=ImageConfig(**raw_config.get("image", {})),
     )
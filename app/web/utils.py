@@ -1,7 +1,10 @@
-from typing import Any, Optional
+import json
+from typing import Any, AsyncIterator, Optional
 
 from aiohttp.web import json_response as aiohttp_json_response
-from aiohttp.web_response import Response
+from aiohttp.web_request import Request
+from aiohttp.web_response import Response, StreamResponse
+from marshmallow import Schema
 
 
 def json_response(data: Any = None, status: str = "ok") -> Response:
@@ -31,3 +34,15 @@ def error_json_response(
             "data": data,
         },
     )
+
+
+async def ndjson_response(request: Request, batches: AsyncIterator[list], schema: Schema) -> StreamResponse:
+    """Потоковый ответ: по объекту JSON на строку, пачка объектов записывается одним куском"""
+    response = StreamResponse(headers={"Content-Type": "application/x-ndjson"})
+    response.enable_chunked_encoding()
+    await response.prepare(request)
+    async for batch in batches:
+        chunk = "".join(json.dumps(item, ensure_ascii=False) + "\n" for item in schema.dump(batch, many=True))
+        await response.write(chunk.encode())
+    await response.write_eof()
+    return response
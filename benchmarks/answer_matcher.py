@@ -0,0 +1,27 @@
+"""Микробенчмарк проверки ответа: python -m benchmarks.answer_matcher"""
+from timeit import repeat
+
+from app.store.game.answer_matcher import AnswerMatcher
+
+ANSWERS = ["Панды", "Большая панда", "Бамбуковый медведь"]
+CASES = {
+    "точный ответ": "панды",
+    "пунктуация и ё": "  Панды!!! ",
+    "опечатка": "бамбуковый медвдь",
+    "неверный ответ": "коалы",
+    "длинный неверный ответ": "это определенно какой-то очень длинный и совершенно неверный ответ",
+}
+NUMBER = 10000
+
+
+def main():
+    for stemming in (False, True):
+        matcher = AnswerMatcher(ANSWERS, stemming=stemming)
+        print(f"stemming={stemming}")
+        for name, answer in CASES.items():
+            best = min(repeat(lambda: matcher.match(answer), number=NUMBER, repeat=5)) / NUMBER
+            print(f"  {name:<24} {matcher.match(answer)!s:<6} {best * 1e6:8.2f} мкс")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,37 @@
+"""Время кодирования и размер картинок по профилям кодирования: python -m benchmarks.image_encoding"""
+import os
+from timeit import repeat
+
+from app.store.bot.image_app import IMAGES_DIR, ImageRenderer, get_img_to_send
+from app.web.config import ImageConfig
+
+TEXT = "Какое животное питается почти исключительно бамбуком и проводит за едой до 14 часов в день?"
+PROFILES = {
+    "png": ImageConfig(),
+    "png optimize": ImageConfig(optimize=True),
+    "png 256 цветов": ImageConfig(colors=256),
+    "png 64 цвета": ImageConfig(colors=64),
+    "png 256 цветов optimize": ImageConfig(colors=256, optimize=True),
+    "jpeg 85": ImageConfig(format="jpeg"),
+    "jpeg 75 optimize": ImageConfig(format="jpeg", quality=75, optimize=True),
+    "jpeg 85, до 480 пикс.": ImageConfig(format="jpeg", max_width=480, max_height=480),
+}
+NUMBER = 3
+
+
+def main():
+    renderer = ImageRenderer()
+    renderer.preload()
+    print(f"{'профиль':<26}" + "".join(f"{name:>24}" for name in sorted(os.listdir(IMAGES_DIR))))
+    for name, profile in PROFILES.items():
+        cells = []
+        for image_path in sorted(renderer.backgrounds):
+            img = renderer.get_background(image_path).copy()
+            data = get_img_to_send(img, profile)
+            best = min(repeat(lambda: get_img_to_send(img, profile), number=NUMBER, repeat=3)) / NUMBER
+            cells.append(f"{len(data) / 1024:8.0f} КБ {best * 1e3:7.1f} мс")
+        print(f"{name:<26}" + "".join(f"{cell:>24}" for cell in cells))
+
+
+if __name__ == "__main__":
+    main()
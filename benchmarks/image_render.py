@@ -0,0 +1,58 @@
+"""Микробенчмарк отрисовки картинки вопроса: python -m benchmarks.image_render"""
+import asyncio
+from textwrap import wrap
+from timeit import repeat
+
+from PIL import Image, ImageDraw, ImageFont
+
+from app.store.bot.image_app import MAIN_FONT_PATH, NAME_FONT_PATH, ImageRenderer, get_img_to_send
+from app.store.bot.image_cache import ImageCache
+
+IMAGE_PATH = "assets/images/question.png"
+TEXT = "Какое животное питается почти исключительно бамбуком и проводит за едой до 14 часов в день?"
+AUTHOR = "Иван Иванов"
+
+
+def load_from_disk() -> tuple:
+    """То, что раньше делал каждый вызов create_image до отрисовки"""
+    img = Image.open(IMAGE_PATH)
+    img.load()
+    return img, ImageFont.truetype(MAIN_FONT_PATH, size=24), ImageFont.truetype(NAME_FONT_PATH, size=16)
+
+
+def render_from_disk() -> bytes:
+    img, main_font, name_font = load_from_disk()
+    draw = ImageDraw.Draw(img)
+    draw.text((40, 20), text=f"Автор вопроса: {AUTHOR}", font=name_font, fill="#858362")
+    offset = 200
+    for line in wrap(TEXT, width=40):
+        draw.text((310, offset), line, font=main_font, fill="#F7F6A8", anchor="mm")
+        offset += 30
+    return get_img_to_send(img)
+
+
+def best_of(func, number: int) -> float:
+    return min(repeat(func, number=number, repeat=5)) / number
+
+
+def main():
+    renderer = ImageRenderer()
+    renderer.preload()
+    cache = ImageCache(maxsize=16, renderer=renderer)
+    asyncio.run(cache.set(IMAGE_PATH, TEXT, AUTHOR, renderer.render(IMAGE_PATH, TEXT, AUTHOR)))
+    key = cache.make_key(IMAGE_PATH, TEXT, AUTHOR)
+    background = renderer.get_background(IMAGE_PATH)
+    cases = {
+        "чтение фона и шрифтов": (load_from_disk, 20),
+        "копия фона в памяти": (background.copy, 200),
+        "кодирование PNG": (lambda: get_img_to_send(background), 10),
+        "create_image до": (render_from_disk, 10),
+        "ImageRenderer": (lambda: renderer.render(IMAGE_PATH, TEXT, AUTHOR), 10),
+        "ImageCache, попадание": (lambda: cache.memory.get(key), 10000),
+    }
+    for name, (func, number) in cases.items():
+        print(f"  {name:<24} {best_of(func, number) * 1e3:10.3f} мс")
+
+
+if __name__ == "__main__":
+    main()
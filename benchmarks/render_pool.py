@@ -0,0 +1,46 @@
+"""Пачка отрисовок разных картинок и задержка цикла событий: python -m benchmarks.render_pool"""
+import asyncio
+import os
+from time import perf_counter
+
+from app.store.bot.image_app import create_render_executor
+from app.store.bot.image_cache import ImageCache
+
+IMAGE_PATH = "assets/images/question.png"
+RENDERS = 16
+TICK = 0.005
+
+
+async def measure(kind: str) -> None:
+    cache = ImageCache(maxsize=RENDERS, executor=create_render_executor(kind))
+    cache.renderer.preload()
+    await cache.warm_up(os.cpu_count())
+
+    lag = 0.0
+    done = False
+
+    async def ticker():
+        nonlocal lag
+        while not done:
+            started_at = perf_counter()
+            await asyncio.sleep(TICK)
+            lag = max(lag, perf_counter() - started_at - TICK)
+
+    ticker_task = asyncio.create_task(ticker())
+    started_at = perf_counter()
+    await asyncio.gather(*(cache.render(IMAGE_PATH, f"Вопрос номер {n}") for n in range(RENDERS)))
+    elapsed = perf_counter() - started_at
+    done = True
+    await ticker_task
+    cache.close()
+    print(f"  {kind:<8} {RENDERS} картинок за {elapsed:6.2f} с, задержка цикла до {lag * 1e3:8.1f} мс")
+
+
+def main():
+    print(f"ядер: {os.cpu_count()}")
+    for kind in ("none", "thread", "process"):
+        asyncio.run(measure(kind))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,33 @@
+from freezegun import freeze_time
+
+from app.base.lru_cache import LRUCache
+
+
+class TestLRUCache:
+    def test_get_set(self):
+        cache = LRUCache(maxsize=2)
+        cache.set(1, "a")
+        assert cache.get(1) == "a"
+        assert cache.get(2) is None
+        assert cache.stats()["hits"] == 1
+        assert cache.stats()["misses"] == 1
+
+    def test_evicts_least_recently_used(self):
+        cache = LRUCache(maxsize=2)
+        cache.set(1, "a")
+        cache.set(2, "b")
+        cache.get(1)
+        cache.set(3, "c")
+        assert cache.get(2) is None
+        assert cache.get(1) == "a"
+        assert cache.get(3) == "c"
+        assert len(cache) == 2
+
+    def test_ttl(self):
+        with freeze_time() as frozen:
+            cache = LRUCache(maxsize=2, ttl=10)
+            cache.set(1, "a")
+            frozen.tick(5)
+            assert cache.get(1) == "a"
+            frozen.tick(6)
+            assert cache.get(1) is None
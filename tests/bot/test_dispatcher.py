@@ -0,0 +1,91 @@
+import asyncio
+
+from app.store.bot.dispatcher import UpdateDispatcher
+
+
+class RecordingDispatcher(UpdateDispatcher):
+    def __init__(self, delays: dict[int, float] = None, **kwargs):
+        super().__init__(app=None, **kwargs)
+        self.delays = delays or {}
+        self.handled: list[tuple[int, int]] = []
+        self.active = 0
+        self.max_active = 0
+
+    async def handle(self, update: dict) -> None:
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        try:
+            await asyncio.sleep(self.delays.get(update["n"], 0.01))
+            self.handled.append((self.get_peer_id(update), update["n"]))
+        finally:
+            self.active -= 1
+
+
+def make_update(peer_id: int, n: int) -> dict:
+    return {"type": "message_new", "n": n, "object": {"message": {"peer_id": peer_id}}}
+
+
+class TestUpdateDispatcher:
+    async def test_in_order_within_chat(self):
+        # Ранние обновления обрабатываются дольше поздних, но порядок внутри чата сохраняется
+        dispatcher = RecordingDispatcher(delays={n: 0.05 - n * 0.01 for n in range(5)}, workers=4)
+        for n in range(5):
+            await dispatcher.dispatch(make_update(1, n))
+        await dispatcher.stop()
+        assert dispatcher.handled == [(1, n) for n in range(5)]
+        assert dispatcher.max_active == 1
+
+    async def test_parallel_across_chats(self):
+        dispatcher = RecordingDispatcher(delays={0: 0.05}, workers=4)
+        for peer_id in range(1, 5):
+            await dispatcher.dispatch(make_update(peer_id, 0))
+        await dispatcher.stop()
+        assert sorted(dispatcher.handled) == [(peer_id, 0) for peer_id in range(1, 5)]
+        assert dispatcher.max_active == 4
+
+    async def test_workers_limit(self):
+        dispatcher = RecordingDispatcher(workers=2)
+        for peer_id in range(1, 7):
+            await dispatcher.dispatch(make_update(peer_id, 0))
+        await dispatcher.stop()
+        assert len(dispatcher.handled) == 6
+        assert dispatcher.max_active == 2
+
+    async def test_backpressure(self):
+        dispatcher = RecordingDispatcher(delays={0: 0.05}, workers=1, queue_size=1)
+        await dispatcher.dispatch(make_update(1, 0))
+        second = asyncio.create_task(dispatcher.dispatch(make_update(2, 1)))
+        await asyncio.sleep(0.01)
+        # Место в очереди освободится только после обработки первого обновления
+        assert not second.done()
+        await asyncio.wait_for(second, timeout=1)
+        await dispatcher.stop()
+        assert dispatcher.handled == [(1, 0), (2, 1)]
+        assert dispatcher.pending_count == 0
+
+    async def test_idle_lane_is_reaped(self):
+        dispatcher = RecordingDispatcher(workers=1, idle_timeout=0.02)
+        await dispatcher.dispatch(make_update(1, 0))
+        await asyncio.sleep(0.1)
+        assert 1 not in dispatcher.lanes
+        await dispatcher.dispatch(make_update(1, 1))
+        await dispatcher.stop()
+        assert dispatcher.handled == [(1, 0), (1, 1)]
+
+    async def test_no_updates_lost_at_idle_timeout(self):
+        # Обновления приходят примерно в момент истечения таймаута простоя
+        dispatcher = RecordingDispatcher(delays={n: 0 for n in range(100)}, workers=1, queue_size=10, idle_timeout=0.002)
+        for n in range(100):
+            await dispatcher.dispatch(make_update(1, n))
+            await asyncio.sleep(0.002)
+        await dispatcher.stop()
+        assert dispatcher.handled == [(1, n) for n in range(100)]
+        assert dispatcher.pending_count == 0
+
+    async def test_redelivered_event_is_skipped(self):
+        dispatcher = RecordingDispatcher(workers=1)
+        update = {**make_update(1, 0), "event_id": "abc"}
+        await dispatcher.dispatch(update)
+        await dispatcher.dispatch(dict(update))
+        await dispatcher.stop()
+        assert dispatcher.handled == [(1, 0)]
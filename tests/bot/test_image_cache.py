@@ -0,0 +1,18 @@
+from app.store.bot.image_cache import ImageCache
+
+
+class TestImageCache:
+    async def test_disk_round_trip(self, tmp_path):
+        await ImageCache(maxsize=4, directory=str(tmp_path)).set("bg.png", "Вопрос", "Автор", b"image")
+
+        # Новый кэш с пустой памятью находит картинку на диске
+        cache = ImageCache(maxsize=4, directory=str(tmp_path))
+        assert await cache.get("bg.png", "Вопрос", "Автор") == b"image"
+        assert await cache.get("bg.png", "Другой вопрос", "Автор") is None
+        assert cache.disk_hits == 1
+
+    async def test_memory_only(self):
+        cache = ImageCache(maxsize=4)
+        await cache.set("bg.png", "Вопрос", None, b"image")
+        assert await cache.get("bg.png", "Вопрос") == b"image"
+        assert cache.disk_hits == 0
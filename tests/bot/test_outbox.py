@@ -0,0 +1,50 @@
+from app.store.bot.outbox import MAX_ATTACHMENTS, MAX_TEXT_LENGTH, Outbox
+from app.store.vk_api.dataclasses import Action, Button, Keyboard, Message, Priority
+
+
+def make_message(text: str = "", attachment: str = None, keyboard: Keyboard = None, **kwargs) -> Message:
+    return Message(peer_id=1, text=text, keyboard=keyboard, attachment=attachment, **kwargs)
+
+
+def make_keyboard(label: str) -> Keyboard:
+    return Keyboard(one_time=True, buttons=[[Button(action=Action(type="text", label=label, payload="{}"))]])
+
+
+class TestOutboxMerge:
+    def test_texts_are_joined(self):
+        prev = make_message("первое", priority=Priority.LOW)
+        assert Outbox._merge(prev, make_message("второе", priority=Priority.HIGH))
+        assert prev.text == "первое\n\nвторое"
+        assert prev.priority == Priority.HIGH
+
+    def test_no_text_after_attachment(self):
+        prev = make_message("вопрос", attachment="photo1_1")
+        assert not Outbox._merge(prev, make_message("ответ"))
+        assert prev.text == "вопрос"
+        # Вложение без текста после вложения склеивается
+        assert Outbox._merge(prev, make_message(attachment="photo1_2", photos={"photo1_2": b"png"}))
+        assert prev.attachment == "photo1_1,photo1_2"
+        assert prev.photos == {"photo1_2": b"png"}
+
+    def test_attachments_limit(self):
+        prev = make_message(attachment=",".join(f"photo1_{n}" for n in range(MAX_ATTACHMENTS - 1)))
+        assert Outbox._merge(prev, make_message(attachment="photo1_100"))
+        assert len(prev.attachment.split(",")) == MAX_ATTACHMENTS
+        assert not Outbox._merge(prev, make_message(attachment="photo1_101"))
+
+    def test_text_length_limit(self):
+        prev = make_message("а" * (MAX_TEXT_LENGTH - 10))
+        assert not Outbox._merge(prev, make_message("б" * 10))
+        # Разделитель \n\n тоже считается в длину
+        assert Outbox._merge(prev, make_message("б" * 8))
+        assert len(prev.text) == MAX_TEXT_LENGTH
+
+    def test_keyboard_conflict(self):
+        prev = make_message("первое", keyboard=make_keyboard("Да"))
+        assert not Outbox._merge(prev, make_message("второе", keyboard=make_keyboard("Нет")))
+        assert Outbox._merge(prev, make_message("второе", keyboard=make_keyboard("Да")))
+        # Клавиатура одного из сообщений сохраняется после склейки
+        prev = make_message("первое")
+        keyboard = make_keyboard("Да")
+        assert Outbox._merge(prev, make_message("второе", keyboard=keyboard))
+        assert prev.keyboard == keyboard
@@ -0,0 +1,55 @@
+from app.store.bot.router import CommandRouter
+
+
+async def handler(ctx):
+    return [ctx.reply(ctx.args, "test")]
+
+
+def make_router() -> CommandRouter:
+    router = CommandRouter()
+    router.add_command("/start", handler)
+    router.add_command("/answer", handler, with_args=True)
+    router.add_mention(handler)
+    router.add_payload("{\"game\":\"ready\"}", handler)
+    return router
+
+
+def make_update(text: str, peer_id: int = 2000000001, **message) -> dict:
+    return {
+        "type": "message_new",
+        "object": {
+            "message": {"id": 1, "peer_id": peer_id, "from_id": 1, "text": text, **message}
+        }
+    }
+
+
+class TestCommandRouter:
+    def test_chatter_is_skipped(self):
+        router = make_router()
+        assert router.resolve({"text": "всем привет"}) == (None, "")
+        assert router.resolve({"text": ""}) == (None, "")
+        assert router.resolve({"text": "/unknown"}) == (None, "")
+
+    def test_command_args(self):
+        router = make_router()
+        assert router.resolve({"text": "/start"}) == (handler, "")
+        assert router.resolve({"text": "/start now"}) == (None, "")
+        assert router.resolve({"text": "/answer панды"}) == (handler, "панды")
+        assert router.resolve({"text": "/answer"}) == (None, "")
+
+    def test_mention_and_payload(self):
+        router = make_router()
+        assert router.resolve({"text": "[id1|Иван Иванов]"}) == (handler, "")
+        assert router.resolve({"text": "[id1 Иван"}) == (None, "")
+        assert router.resolve({"text": "Присоединиться", "payload": "{\"game\":\"ready\"}"}) == (handler, "")
+
+    async def test_route(self):
+        router = make_router()
+        updates = await router.route(make_update("/answer панды"))
+        assert len(updates) == 1
+        assert updates[0].object.body == "панды"
+        assert updates[0].object.event_type == "test"
+
+    async def test_personal_messages_are_skipped(self):
+        router = make_router()
+        assert await router.route(make_update("/start", peer_id=1)) == []
@@ -0,0 +1,40 @@
+from app.store.game.answer_matcher import AnswerMatcher, bounded_distance, normalize
+
+
+class TestNormalize:
+    def test_case_punctuation_and_yo(self):
+        assert normalize("  Ёжик,   в тумане! ") == "ежик в тумане"
+
+    def test_stemming(self):
+        assert normalize("Панды", stemming=True) == normalize("панда", stemming=True)
+
+
+class TestBoundedDistance:
+    def test_distance(self):
+        assert bounded_distance("панда", "панда", 2) == 0
+        assert bounded_distance("панда", "пнада", 2) == 1
+        assert bounded_distance("медведь", "медвдь", 2) == 1
+
+    def test_cutoff(self):
+        assert bounded_distance("панда", "коала", 1) == 2
+        assert bounded_distance("а", "очень длинный ответ", 2) == 3
+
+
+class TestAnswerMatcher:
+    def test_match(self):
+        matcher = AnswerMatcher(["Панды", "Бамбуковый медведь"])
+        assert matcher.match("панды")
+        assert matcher.match("Панды!")
+        assert matcher.match("бамбуковый медвдь")
+        assert not matcher.match("коалы")
+
+    def test_short_answers_are_exact(self):
+        matcher = AnswerMatcher(["Кот"])
+        assert matcher.match("кот")
+        assert not matcher.match("кит")
+
+    def test_numbers_are_exact(self):
+        assert not AnswerMatcher(["1945"]).match("1944")
+        assert not AnswerMatcher(["1812 год"]).match("1821 год")
+        assert AnswerMatcher(["1812 год"]).match("1812 гд")
+        assert not AnswerMatcher(["Панды"]).match("панды1")
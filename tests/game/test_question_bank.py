@@ -0,0 +1,102 @@
+from contextlib import asynccontextmanager
+from types import SimpleNamespace
+
+from app.game.dataclasses import Answer, Question
+from app.store.game.question_bank import QuestionBank
+from tests.utils import make_game_accessor
+
+
+def make_question(question_id: int, answer: str = "панда", is_approved: bool = True) -> Question:
+    return Question(
+        id=question_id, title=f"Вопрос {question_id}", answer_desc="", answers=[Answer(title=answer)],
+        is_approved=is_approved, author_id=None
+    )
+
+
+class FakeSession:
+    def __init__(self):
+        self.added = []
+        self.executed = []
+
+    def add(self, obj) -> None:
+        self.added.append(obj)
+
+    async def flush(self) -> None:
+        for obj in self.added:
+            obj.id = 42
+
+    async def execute(self, statement) -> None:
+        self.executed.append(statement)
+
+
+def make_database(session: FakeSession) -> SimpleNamespace:
+    @asynccontextmanager
+    async def transaction():
+        yield session
+
+    return SimpleNamespace(transaction=transaction)
+
+
+class TestQuestionBank:
+    def test_load_and_check_answer(self):
+        bank = QuestionBank()
+        assert not bank.is_loaded
+        bank.load([make_question(1, "Панды"), make_question(2, "Бамбук")])
+
+        assert bank.is_loaded and len(bank) == 2 and 1 in bank
+        assert bank.check_answer(1, "панды!")
+        assert not bank.check_answer(1, "бамбук")
+        assert not bank.check_answer(3, "панды")
+
+    def test_load_replaces_questions(self):
+        bank = QuestionBank()
+        bank.load([make_question(1)])
+        bank.load([make_question(2)])
+        assert bank.ids() == [2]
+        assert not bank.check_answer(1, "панда")
+
+    def test_remove(self):
+        bank = QuestionBank()
+        bank.load([make_question(1)])
+        bank.remove(1)
+        bank.remove(2)
+        assert bank.get(1) is None
+        assert not bank.check_answer(1, "панда")
+
+
+class TestQuestionBankSync:
+    async def test_create_question(self):
+        accessor = make_game_accessor(make_database(FakeSession()))
+        accessor.question_bank.load([])
+
+        await accessor.create_question("Вопрос", "", [Answer(title="панда")], None, is_approved=True)
+        await accessor.create_question("Черновик", "", [Answer(title="коала")], None, is_approved=False)
+
+        # В банк попадают только одобренные вопросы
+        assert accessor.question_bank.ids() == [42]
+        assert accessor.question_bank.check_answer(42, "панда")
+
+    async def test_approve_question(self):
+        accessor = make_game_accessor(make_database(FakeSession()))
+        accessor.question_bank.load([])
+
+        async def get_question_by_id(id_: int) -> Question:
+            return make_question(id_)
+
+        accessor.get_question_by_id = get_question_by_id
+        await accessor.approve_question(7)
+        assert accessor.question_bank.check_answer(7, "панда")
+
+    async def test_delete_question(self):
+        accessor = make_game_accessor(make_database(FakeSession()))
+        accessor.question_bank.load([make_question(7)])
+
+        await accessor.delete_question(7)
+        assert 7 not in accessor.question_bank
+        assert not accessor.question_bank.check_answer(7, "панда")
+
+    async def test_not_loaded_bank_stays_empty(self):
+        # Незагруженный банк будет прочитан из БД целиком при первом обращении
+        accessor = make_game_accessor(make_database(FakeSession()))
+        await accessor.create_question("Вопрос", "", [Answer(title="панда")], None, is_approved=True)
+        assert len(accessor.question_bank) == 0 and not accessor.question_bank.is_loaded
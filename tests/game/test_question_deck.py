@@ -0,0 +1,86 @@
+import pytest
+
+from app.game.dataclasses import Answer, Question
+from app.store.game.accessor import DECK_SIZE
+from tests.utils import make_game, make_game_accessor
+
+
+def make_question(question_id: int) -> Question:
+    return Question(
+        id=question_id, title=f"Вопрос {question_id}", answer_desc="", answers=[Answer(title="панда")],
+        is_approved=True, author_id=None
+    )
+
+
+@pytest.fixture
+def accessor():
+    accessor = make_game_accessor()
+    game = make_game(1)
+    game.is_started = True
+    accessor.state.set(100, game)
+    yield accessor
+    if accessor.state._flush_handle is not None:
+        accessor.state._flush_handle.cancel()
+
+
+class TestDealQuestionDeck:
+    async def test_deals_unused_questions(self, accessor):
+        accessor.question_bank.load([make_question(n) for n in range(1, 21)])
+        game = accessor.state.get(100)
+        game.questions = [make_question(1), make_question(2)]
+
+        deck = await accessor._deal_question_deck(game)
+        assert len(deck) == DECK_SIZE
+        assert len(set(deck)) == DECK_SIZE
+        assert not {1, 2} & set(deck)
+
+    async def test_small_bank(self, accessor):
+        accessor.question_bank.load([make_question(n) for n in range(1, 6)])
+        game = accessor.state.get(100)
+        game.questions = [make_question(1)]
+
+        assert sorted(await accessor._deal_question_deck(game)) == [2, 3, 4, 5]
+
+    async def test_repeats_when_all_questions_were_asked(self, accessor):
+        accessor.question_bank.load([make_question(n) for n in range(1, 4)])
+        game = accessor.state.get(100)
+        game.questions = [make_question(n) for n in range(1, 4)]
+
+        assert sorted(await accessor._deal_question_deck(game)) == [1, 2, 3]
+
+
+class TestGetQuestionForGame:
+    async def test_pops_from_deck(self, accessor):
+        accessor.question_bank.load([make_question(n) for n in range(1, 4)])
+        game = accessor.state.get(100)
+        game.question_deck = [1, 2, 3]
+
+        question = await accessor.get_question_for_game(100)
+        assert question.id == 3
+        assert game.current_question == 3
+        assert game.question_deck == [1, 2]
+        assert [q.id for q in game.questions] == [3]
+
+    async def test_redeals_empty_deck(self, accessor):
+        accessor.question_bank.load([make_question(n) for n in range(1, 4)])
+        game = accessor.state.get(100)
+        game.questions = [make_question(1), make_question(2)]
+
+        question = await accessor.get_question_for_game(100)
+        # Колода раздана заново из еще не заданных вопросов
+        assert question.id == 3
+        assert game.question_deck == []
+
+    async def test_skips_deleted_questions(self, accessor):
+        accessor.question_bank.load([make_question(n) for n in range(1, 4)])
+        game = accessor.state.get(100)
+        game.question_deck = [1, 2]
+        accessor.question_bank.remove(2)
+
+        assert (await accessor.get_question_for_game(100)).id == 1
+        assert game.question_deck == []
+
+    async def test_no_approved_questions(self, accessor):
+        accessor.question_bank.load([])
+        with pytest.raises(LookupError):
+            await accessor.get_question_for_game(100)
@@ -0,0 +1,147 @@
+from contextlib import asynccontextmanager
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy.exc import DataError, IntegrityError, OperationalError
+
+from app.game.dataclasses import Answer, Game, Question, User
+from app.game.models import games_questions, games_users
+from app.store.game.state import GameStateStore
+from tests.utils import make_game, make_game_accessor
+
+
+@pytest.fixture
+def state() -> GameStateStore:
+    state = GameStateStore(app=None, flush_interval=60)
+    state.set(100, make_game(1))
+    state.set(200, make_game(2))
+    yield state
+    if state._flush_handle is not None:
+        state._flush_handle.cancel()
+
+
+class TestUnitOfWork:
+    async def test_commit_queues_writes(self, state):
+        with state.unit_of_work():
+            state.update(state.get(100), bot_score=1)
+            state.insert(games_users, game_id=1, user_id=5)
+            # До фиксации в очередь записи ничего не попадает
+            assert not state._updates and not state._inserts
+
+        assert state._updates == {1: {"bot_score": 1}}
+        assert state._inserts == [(games_users, {"game_id": 1, "user_id": 5})]
+
+    async def test_rollback_discards_writes(self, state):
+        with pytest.raises(RuntimeError):
+            with state.unit_of_work():
+                state.update(state.get(100), bot_score=1)
+                state.insert(games_users, game_id=1, user_id=5)
+                raise RuntimeError
+
+        assert not state._updates and not state._inserts
+        # Затронутая игра будет перечитана из БД, остальные остаются в памяти
+        assert 100 not in state
+        assert state.get(200).bot_score == 0
+
+
+class TestReloadAfterRollback:
+    async def test_pending_writes_are_applied(self):
+        accessor = make_game_accessor()
+        accessor.question_bank.load([
+            Question(
+                id=7, title="Вопрос", answer_desc="", answers=[Answer(title="панда")], is_approved=True, author_id=None
+            )
+        ])
+
+        async def read_active_game(vk_chat_id: int) -> Game:
+            # В БД еще нет изменений, ждущих отложенной записи
+            game = make_game(1)
+            game.is_started = True
+            game.players = [User(id=11, vk_id=5)]
+            game.question_deck = [7]
+            return game
+
+        accessor._read_active_game = read_active_game
+        with accessor.state.unit_of_work():
+            await accessor.get_question_for_game(100)
+            await accessor.choose_respondent(100, vk_user_id=5)
+        assert accessor.state._updates[1]["respondent_id"] == 11
+
+        with pytest.raises(RuntimeError):
+            with accessor.state.unit_of_work():
+                game = await accessor.get_game_by_vk_id(100, is_started=True, is_finished=False)
+                accessor.state.update(game, bot_score=1)
+                raise RuntimeError
+
+        # Игра перечитана из БД вместе с зафиксированными, но еще не записанными изменениями
+        assert (await accessor.get_respondent(100)).id == 11
+        game = await accessor.get_game_by_vk_id(100, is_started=True, is_finished=False)
+        assert game.current_question == 7
+        assert [question.id for question in game.questions] == [7]
+        assert game.bot_score == 0
+        accessor.state._flush_handle.cancel()
+
+
+class FakeSession:
+    """Сессия, отклоняющая запись удаленного вопроса и неверное значение поля"""
+
+    def __init__(self):
+        self.committed: list[dict] = []
+        self._savepoint: list[dict] = []
+
+    @asynccontextmanager
+    async def begin_nested(self):
+        self._savepoint = []
+        yield
+        self.committed.extend(self._savepoint)
+
+    async def execute(self, statement) -> None:
+        params = statement.compile().params
+        if params.get("question_id") == 99:
+            raise IntegrityError("insert", params, Exception("foreign key violation"))
+        if params.get("bot_score") == -1:
+            raise DataError("update", params, Exception("check violation"))
+        if params.get("bot_score") == -2:
+            raise OperationalError("update", params, Exception("connection lost"))
+        self._savepoint.append(params)
+
+
+def make_flushing_state(session: FakeSession) -> GameStateStore:
+    @asynccontextmanager
+    async def begin():
+        yield session
+
+    app = SimpleNamespace(database=SimpleNamespace(session=SimpleNamespace(begin=begin)))
+    return GameStateStore(app=app, flush_interval=60)
+
+
+class TestFlush:
+    async def test_failed_game_does_not_block_others(self):
+        session = FakeSession()
+        state = make_flushing_state(session)
+        state.update(make_game(1), bot_score=1)
+        state.insert(games_questions, game_id=2, question_id=99)
+        state.insert(games_questions, game_id=2, question_id=7)
+        state.update(make_game(2), players_score=1, bot_score=-1)
+        await state.flush()
+
+        # Проходящие строки и поля записаны, остальные отложены в dead_letters
+        assert {"question_id": 7, "game_id": 2} in session.committed
+        assert any(params.get("players_score") == 1 for params in session.committed)
+        assert any(params.get("bot_score") == 1 for params in session.committed)
+        assert [(game_id, rows, values) for game_id, rows, values in state.dead_letters] == [
+            (2, [(games_questions, {"game_id": 2, "question_id": 99})], {}),
+            (2, [], {"bot_score": -1}),
+        ]
+        assert not state._updates and not state._inserts
+        assert state.stats()["dead_letters_total"] == 2
+
+    async def test_connection_error_requeues(self):
+        state = make_flushing_state(FakeSession())
+        state.update(make_game(1), bot_score=-2)
+        await state.flush()
+
+        assert state._updates == {1: {"bot_score": -2}}
+        assert not state.dead_letters
+        assert state.stats()["failed_flushes"] == 1
+        state._flush_handle.cancel()
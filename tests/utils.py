@@ -1,6 +1,12 @@
+from types import SimpleNamespace
+
 from sqlalchemy import inspect
 from sqlalchemy.ext.asyncio import AsyncEngine
 
+from app.game.dataclasses import Game
+from app.store.game.accessor import GameAccessor
+from app.web.config import GameConfig
+
 
 def ok_response(data: dict):
     return {
@@ -28,3 +34,19 @@ async def check_empty_table_exists(cli, tablename: str):
         tables = await conn.run_sync(use_inspector)
 
     assert tablename in tables
+
+
+def make_game_accessor(database=None) -> GameAccessor:
+    """GameAccessor без БД и VK: для проверки логики, не обращающейся к ним, или с подставной БД"""
+    app = SimpleNamespace(
+        config=SimpleNamespace(game=GameConfig(flush_interval=60)), database=database, on_startup=[], on_cleanup=[]
+    )
+    return GameAccessor(app)
+
+
+def make_game(game_id: int) -> Game:
+    return Game(
+        id=game_id, chat_id=game_id, capitan_id=None, respondent_id=None, current_question=None,
+        question_time=None, bot_score=0, players_score=0, is_started=False, is_finished=False,
+        questions=[], players=[]
+    )
@@ -0,0 +1,44 @@
+import asyncio
+
+from app.store.vk_api.dataclasses import Priority
+from app.store.vk_api.exceptions import VkApiError
+from app.store.vk_api.execute_batcher import ExecuteBatcher
+
+INVALID_ATTACHMENT = {"method": "messages.send", "error_code": 100, "error_msg": "Invalid attachment"}
+TOO_MANY_REQUESTS = {"method": "messages.send", "error_code": 6, "error_msg": "Too many requests per second"}
+
+
+class FakeVkApi:
+    def __init__(self, data: dict):
+        self.data = data
+
+    async def execute(self, code: str, priority: Priority = Priority.NORMAL) -> dict:
+        return self.data
+
+
+async def call_all(data: dict, calls: int) -> list:
+    batcher = ExecuteBatcher(FakeVkApi(data))
+    return await asyncio.gather(
+        *(batcher.call("messages.send", {"peer_id": n}) for n in range(calls)),
+        return_exceptions=True
+    )
+
+
+class TestExecuteBatcher:
+    async def test_each_call_gets_its_own_error(self):
+        results = await call_all(
+            {"response": [1, False, 3, False], "execute_errors": [INVALID_ATTACHMENT, TOO_MANY_REQUESTS]}, 4
+        )
+        assert results[0] == 1 and results[2] == 3
+        assert results[1].error == INVALID_ATTACHMENT and results[1].is_invalid_attachment
+        assert results[3].code == 6 and not results[3].is_invalid_attachment
+
+    async def test_whole_batch_error(self):
+        results = await call_all({"error": {"error_code": 6, "error_msg": "Too many requests per second"}}, 2)
+        assert all(isinstance(result, VkApiError) and not result.is_invalid_attachment for result in results)
+
+    def test_params_are_passed_unchanged(self):
+        code = ExecuteBatcher._build_code(
+            [("messages.send", {"message": "100%25 верно\nда", "attachment": None}, Priority.NORMAL, None)]
+        )
+        assert code == 'return [API.messages.send({"message": "100%25 верно\\nда"})];'
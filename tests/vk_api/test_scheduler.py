@@ -0,0 +1,60 @@
+import asyncio
+from time import monotonic
+
+from app.store.vk_api.dataclasses import Priority
+from app.store.vk_api.scheduler import RequestScheduler
+
+
+def recording_request(sent: list, name: str):
+    async def request() -> str:
+        sent.append(name)
+        return name
+    return request
+
+
+class TestRequestScheduler:
+    async def test_priority_order(self):
+        scheduler = RequestScheduler(rate=50, burst=1)
+        sent = []
+        low = [
+            asyncio.create_task(scheduler.submit(Priority.LOW, recording_request(sent, f"low{n}"))) for n in range(3)
+        ]
+        # Срочные запросы приходят, пока low1 ждет токен, и должны его обогнать
+        await asyncio.sleep(0.005)
+        high = [
+            asyncio.create_task(scheduler.submit(Priority.HIGH, recording_request(sent, f"high{n}"))) for n in range(3)
+        ]
+        await asyncio.gather(*low, *high)
+        await scheduler.stop()
+
+        assert sent == ["low0", "high0", "high1", "high2", "low1", "low2"]
+
+    async def test_refill_rate(self):
+        scheduler = RequestScheduler(rate=20, burst=2)
+        sent = []
+        started_at = monotonic()
+        await asyncio.gather(
+            *(scheduler.submit(Priority.NORMAL, recording_request(sent, str(n))) for n in range(6))
+        )
+        elapsed = monotonic() - started_at
+        await scheduler.stop()
+
+        # Два запроса уходят сразу, остальные четыре - по одному за 1 / rate секунд
+        assert len(sent) == 6
+        assert 0.19 <= elapsed < 0.3
+
+    async def test_wait_metrics(self):
+        scheduler = RequestScheduler(rate=20, burst=1)
+        await asyncio.gather(
+            *(scheduler.submit(Priority.NORMAL, recording_request([], str(n))) for n in range(3))
+        )
+        stats = scheduler.stats()
+        await scheduler.stop()
+
+        normal = stats["priorities"]["normal"]
+        assert normal["requests"] == 3
+        # Ожидания: около 0, 0.05 и 0.1 секунды
+        assert 0.09 <= normal["max_wait"] < 0.2
+        assert 0.04 <= normal["avg_wait"] < 0.1
+        assert stats["priorities"]["high"]["requests"] == 0
+        assert stats["queue_size"] == 0